@@ -0,0 +1,188 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from embedding_index import atomic_write, embedding_index_path
+from similarity import CosineScorer, normalize_rows, top_k_indices
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLES_PER_LIST = 64
+ASSIGN_CHUNK_SIZE = 1 << 16
+
+def ivf_index_path(model_path):
+    """Centroids and inverted lists clustered from a model file's movie embeddings."""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}.ivf.npz"
+
+def assign_to_centroids(vectors, centroids):
+    # Chunked so the (rows x lists) score matrix stays small on large catalogs
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+        chunk = vectors[start:start + ASSIGN_CHUNK_SIZE]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+def spherical_kmeans(vectors, n_clusters, n_iter=KMEANS_ITERATIONS, seed=0):
+    """k-means on unit vectors, with centroids re-normalized so they can be scored by dot product."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.empty_like(centroids)
+        for dim in range(vectors.shape[1]):
+            sums[:, dim] = np.bincount(assignments, weights=vectors[:, dim], minlength=n_clusters)
+        # Re-seed empty lists from random points instead of letting them die
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+class IVFIndex:
+    """Inverted-file index: a k-means coarse quantizer over normalized movie embeddings.
+
+    Only the nprobe lists whose centroids are closest to the query are scanned, so
+    nprobe trades recall for latency. Candidates are scored exactly, so returned
+    similarity scores match CosineScorer for every movie that is found.
+    """
+
+    def __init__(self, centroids, offsets, ids, vectors, nprobe=DEFAULT_NPROBE, key=""):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.nprobe = nprobe
+        self.key = key
+
+    @classmethod
+    def build(cls, embeddings, n_lists=None, nprobe=DEFAULT_NPROBE, seed=0, key=""):
+        vectors = normalize_rows(embeddings)
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+
+        # Train the quantizer on a sample; assigning the full catalog is a single pass
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), n_lists * KMEANS_SAMPLES_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = spherical_kmeans(sample, n_lists, seed=seed)
+
+        assignments = assign_to_centroids(vectors, centroids)
+        ids = np.argsort(assignments, kind="stable")
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+        return cls(centroids, offsets, ids, np.ascontiguousarray(vectors[ids]), nprobe=nprobe, key=key)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def top_k(self, query, k, nprobe=None, candidates=None):
+        """Approximate k best rows, optionally only among candidates (sorted row ids)."""
+        query = normalize_rows(np.ravel(query))
+        nprobe = self.nprobe if nprobe is None else nprobe
+        list_order = np.argsort(self.centroids @ query)[::-1]
+        allowed = None
+        if candidates is not None:
+            allowed = np.zeros(len(self.ids), dtype=bool)
+            allowed[candidates] = True
+
+        # Probe at least nprobe lists, and keep going until there are k candidates
+        candidate_ids, candidate_scores, found = [], [], 0
+        for probed, list_id in enumerate(list_order):
+            if probed >= nprobe and found >= k:
+                break
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            list_ids, list_vectors = self.ids[start:end], self.vectors[start:end]
+            if allowed is not None:
+                # Filtered rows do not count towards k, so narrow filters probe more lists
+                keep = allowed[list_ids]
+                list_ids, list_vectors = list_ids[keep], list_vectors[keep]
+            if len(list_ids) == 0:
+                continue
+            candidate_ids.append(list_ids)
+            candidate_scores.append(list_vectors @ query)
+            found += len(list_ids)
+
+        if not candidate_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidate_ids = np.concatenate(candidate_ids)
+        candidate_scores = np.concatenate(candidate_scores)
+        best = top_k_indices(candidate_scores, k)
+        return candidate_ids[best], candidate_scores[best]
+
+    def top_k_batch(self, queries, k, nprobe=None):
+        return [self.top_k(query, k, nprobe=nprobe) for query in np.atleast_2d(queries)]
+
+    def save(self, path):
+        atomic_write(path, lambda f: np.savez(f, key=np.array(self.key), centroids=self.centroids,
+                                              offsets=self.offsets, ids=self.ids, vectors=self.vectors))
+
+    @classmethod
+    def load(cls, path, key=None, nprobe=DEFAULT_NPROBE):
+        """Return the persisted index, or None if it is missing or was built for another key."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as index:
+                if key is not None and str(index["key"]) != key:
+                    return None
+                return cls(index["centroids"], index["offsets"], index["ids"], index["vectors"],
+                           nprobe=nprobe, key=str(index["key"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable IVF index {path}: {e}")
+            return None
+
+def recall_at_k(index, exact_scorer, queries, k, nprobe=None):
+    """Fraction of the exact top-k that the approximate index also returns."""
+    hits = 0
+    for query in queries:
+        exact, _ = exact_scorer.top_k(query, k)
+        approximate, _ = index.top_k(query, k, nprobe=nprobe)
+        hits += len(np.intersect1d(exact, approximate))
+    return hits / (len(queries) * k)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and latency of the IVF index against exact search")
+    parser.add_argument("--embeddings", default=embedding_index_path("vae_model.pth"),
+                        help="persisted embedding index to load (see embedding_index.py)")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random embeddings instead")
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        embeddings = rng.standard_normal((args.synthetic, 10)).astype(np.float32)
+    else:
+        with np.load(args.embeddings) as index:
+            embeddings = index["embeddings"]
+
+    start = time.perf_counter()
+    index = IVFIndex.build(embeddings, n_lists=args.lists)
+    print(f"Built {len(index.centroids)} lists over {len(index)} titles in {time.perf_counter() - start:.2f}s")
+
+    exact = CosineScorer(embeddings)
+    # Queries resemble user embeddings: catalog points with some noise
+    queries = embeddings[rng.choice(len(embeddings), args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    start = time.perf_counter()
+    for query in queries:
+        exact.top_k(query, args.top_n)
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+    print(f"{'nprobe':>7} {'recall':>7} {'ms/query':>9}  (exact: {exact_ms:.3f} ms/query)")
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        for query in queries:
+            index.top_k(query, args.top_n, nprobe=nprobe)
+        ivf_ms = (time.perf_counter() - start) / len(queries) * 1000
+        recall = recall_at_k(index, exact, queries, args.top_n, nprobe=nprobe)
+        print(f"{nprobe:>7} {recall:>7.3f} {ivf_ms:>9.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import time
+
+import numpy as np
+
+from similarity import EMBEDDING_PRECISIONS, CosineScorer, QuantizedScorer
+
+CATALOG_SIZES = [100_000, 1_000_000, 5_000_000]
+LATENT_DIM = 10
+TOP_N = 5
+
+def baseline_top_k(query, movie_embeddings, k):
+    # What generate_recommendations used to do: sklearn cosine_similarity + full argsort
+    from sklearn.metrics.pairwise import cosine_similarity
+    similarity_scores = cosine_similarity(query.reshape(1, -1), movie_embeddings).flatten()
+    top_indices = np.argsort(similarity_scores)[::-1][:k]
+    return top_indices, similarity_scores[top_indices]
+
+def time_per_query(fn, queries):
+    fn(queries[0])  # warm up buffers and BLAS
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+def compare_precisions(movie_embeddings, scorer, queries, precisions, top_n):
+    """Memory, speed and ranking differences of the compact scorers against the float32 one."""
+    expected = [scorer.top_k(q, top_n) for q in queries]
+    float32_ms = time_per_query(lambda q: scorer.top_k(q, top_n), queries)
+    for precision in precisions:
+        compact = QuantizedScorer(movie_embeddings, precision)
+        compact_ms = time_per_query(lambda q: compact.top_k(q, top_n), queries)
+        reordered, changed, max_score_diff = 0, 0, 0.0
+        for query, (indices, scores) in zip(queries, expected):
+            got_indices, got_scores = compact.top_k(query, top_n)
+            if set(got_indices) != set(indices):
+                changed += 1
+            elif not np.array_equal(got_indices, indices):
+                reordered += 1
+            max_score_diff = max(max_score_diff, float(np.max(np.abs(got_scores - scores), initial=0.0)))
+        saved = 1 - compact.codes.nbytes / scorer.embeddings.nbytes
+        print(f"{len(movie_embeddings):>10} {precision:>9} {compact.codes.nbytes / 2**20:>9.1f} {saved:>6.0%} "
+              f"{float32_ms:>10.3f} {compact_ms:>10.3f} {changed:>8} {reordered:>9} {max_score_diff:>10.2e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-query cost of movie-embedding scoring and top-k selection")
+    parser.add_argument("--sizes", type=int, nargs="+", default=CATALOG_SIZES)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=LATENT_DIM)
+    parser.add_argument("--top-n", type=int, default=TOP_N)
+    parser.add_argument("--skip-baseline", action="store_true", help="only time the fused scorer")
+    parser.add_argument("--precision", nargs="+", choices=EMBEDDING_PRECISIONS,
+                        help="instead compare compact embedding stores against float32")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    if args.precision:
+        print(f"{'titles':>10} {'precision':>9} {'MiB':>9} {'saved':>6} {'f32 ms':>10} {'ms':>10} "
+              f"{'changed':>8} {'reordered':>9} {'score diff':>10}")
+        for size in args.sizes:
+            movie_embeddings = rng.standard_normal((size, args.dim)).astype(np.float32)
+            compare_precisions(movie_embeddings, CosineScorer(movie_embeddings), queries, args.precision, args.top_n)
+        return
+    print(f"{'titles':>10} {'baseline ms':>12} {'scorer ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        movie_embeddings = rng.standard_normal((size, args.dim)).astype(np.float32)
+        scorer = CosineScorer(movie_embeddings)
+        scorer_ms = time_per_query(lambda q: scorer.top_k(q, args.top_n), queries)
+        if args.skip_baseline:
+            print(f"{size:>10} {'-':>12} {scorer_ms:>10.3f} {'-':>8}")
+            continue
+        baseline_ms = time_per_query(lambda q: baseline_top_k(q, movie_embeddings, args.top_n), queries)
+        print(f"{size:>10} {baseline_ms:>12.3f} {scorer_ms:>10.3f} {baseline_ms / scorer_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from frontend_templates import genres as GENRES
+from synthetic_data import write_catalog, write_user_data
+
+CATALOG_SIZES = [10_000, 100_000]
+USER_ROWS = 2000 # user_data.csv rows written next to each synthetic catalog
+REQUESTS = 200 # timed queries per stage
+MOVIE_EMBEDDING_REPEATS = 3 # full-catalog encodes timed per size (each one is slow)
+WARMUP_REQUESTS = 10
+REGRESSION_THRESHOLD = 0.10 # a stage regresses when its p50 or p95 grows by more than this
+PERCENTILES = [50, 95, 99]
+SEED = 0
+
+def random_queries(rng, count):
+    """(genres_selected, avg_rating, num_votes) like the ones the main page submits."""
+    queries = []
+    for _ in range(count):
+        selected = rng.choice(len(GENRES), size=rng.integers(1, 4), replace=False)
+        queries.append(([GENRES[i] for i in selected], float(rng.integers(10, 100)) / 10,
+                        int(rng.integers(1, 1000))))
+    return queries
+
+def time_calls(fn, items, warmup=WARMUP_REQUESTS):
+    for item in items[:warmup]:
+        fn(item)
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def summarize(timings):
+    ms = np.asarray(timings) * 1000
+    summary = {f"p{p}": float(np.percentile(ms, p)) for p in PERCENTILES}
+    summary.update(mean=float(ms.mean()), n=len(ms))
+    return summary
+
+def max_rss_mib():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+def benchmark_catalog(num_titles, model_path, num_requests, top_n):
+    """Time every serving stage over a synthetic catalog; runs in a fresh process per size."""
+    import vae_main
+    from frontend import app
+    from similarity import top_k_indices
+
+    rng = np.random.default_rng(SEED)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        movie_path = os.path.join(tmp_dir, "cleaned_data.csv")
+        user_path = os.path.join(tmp_dir, "user_data.csv")
+        num_votes, average_rating = write_catalog(movie_path, num_titles, SEED)
+        write_user_data(user_path, USER_ROWS, num_votes, average_rating, seed=SEED)
+        # The exported encoder and the embedding index are written next to the model,
+        # so work on a copy of it inside the temporary directory
+        tmp_model_path = os.path.join(tmp_dir, os.path.basename(model_path))
+        os.symlink(os.path.abspath(model_path), tmp_model_path)
+        vae_main.MOVIE_DATA_PATH, vae_main.USER_DATA_PATH, vae_main.MODEL_PATH = movie_path, user_path, tmp_model_path
+
+        start = time.perf_counter()
+        vae_main.initialize_globals()
+        startup = dict(vae_main.startup_timings, total=time.perf_counter() - start)
+
+        queries = random_queries(rng, num_requests)
+        inputs = [vae_main.build_user_input_vector(genres, *vae_main.quantize_inputs(rating, votes))
+                  for genres, rating, votes in queries]
+        user_rating = vae_main.DEFAULT_USER_RATING
+        vae, scorer, data = vae_main.vae, vae_main.movie_scorer, vae_main.data
+        embeddings = [vae_main.get_user_embeddings(user_rating, x, vae) for x in inputs]
+        top_k = [scorer.top_k(e, top_n) for e in embeddings]
+
+        stages = {}
+        stages["user_embedding"] = time_calls(lambda x: vae_main.get_user_embeddings(user_rating, x, vae), inputs)
+        stages["movie_embeddings"] = time_calls(
+            lambda _: vae_main.get_movie_embeddings(vae_main.movie_features, vae_main.movie_genres, vae, user_rating),
+            [None] * MOVIE_EMBEDDING_REPEATS, warmup=0)
+        if hasattr(scorer, "scores"):
+            stages["similarity"] = time_calls(scorer.scores, embeddings)
+            all_scores = [scorer.scores(e).copy() for e in embeddings[:WARMUP_REQUESTS]]
+            stages["top_k"] = time_calls(lambda s: top_k_indices(s, top_n),
+                                         all_scores * (num_requests // len(all_scores)))
+        stages["similarity_top_k"] = time_calls(lambda e: scorer.top_k(e, top_n), embeddings)
+        stages["result_assembly"] = time_calls(
+            lambda result: vae_main.assemble_recommendations(vae_main.title_columns, result[0], result[1]), top_k)
+
+        def run_uncached(query):
+            vae_main.result_cache.clear()
+            vae_main.run_for_frontend(*query, top_n=top_n)
+        stages["run_for_frontend"] = time_calls(run_uncached, queries)
+        # Warming up with every query first means each timed call is a cache hit
+        stages["run_for_frontend_cached"] = time_calls(lambda q: vae_main.run_for_frontend(*q, top_n=top_n),
+                                                       queries, warmup=len(queries))
+
+        client = app.test_client()
+        def post_output(query):
+            vae_main.result_cache.clear()
+            genres_selected, rating, votes = query
+            response = client.post("/output", data={"genres": genres_selected, "avg_rating": rating,
+                                                     "votes_num": votes})
+            assert response.status_code == 200 and b"Similarity Score" in response.data, response.status_code
+        stages["http_output"] = time_calls(post_output, queries)
+
+        return {
+            "catalog_titles": len(data),
+            "startup_seconds": startup,
+            "stages_ms": {name: summarize(timings) for name, timings in stages.items()},
+            "max_rss_mib": max_rss_mib(),
+        }
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Print stage-by-stage changes; returns the list of regressions beyond threshold."""
+    regressions = []
+    print(f"{'titles':>10} {'stage':<24} {'base p50':>9} {'p50':>9} {'change':>7} {'base p95':>9} {'p95':>9} "
+          f"{'change':>7}")
+    for size, result in current["results"].items():
+        base = baseline["results"].get(size)
+        if base is None:
+            continue
+        for stage, summary in result["stages_ms"].items():
+            base_summary = base["stages_ms"].get(stage)
+            if base_summary is None:
+                continue
+            changes = {p: summary[p] / base_summary[p] - 1 for p in ("p50", "p95") if base_summary[p] > 0}
+            regressed = [p for p, change in changes.items() if change > threshold]
+            if regressed:
+                regressions.append((size, stage, regressed))
+            print(f"{size:>10} {stage:<24} {base_summary['p50']:>9.3f} {summary['p50']:>9.3f} "
+                  f"{changes.get('p50', 0):>+7.0%} {base_summary['p95']:>9.3f} {summary['p95']:>9.3f} "
+                  f"{changes.get('p95', 0):>+7.0%}{'  REGRESSION' if regressed else ''}")
+        print(f"{size:>10} {'max_rss_mib':<24} {base['max_rss_mib']:>9.1f} {result['max_rss_mib']:>9.1f} "
+              f"{result['max_rss_mib'] / base['max_rss_mib'] - 1:>+7.0%}")
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+def print_results(results):
+    for size, result in results.items():
+        startup = result["startup_seconds"]
+        print(f"\n{size} titles ({result['catalog_titles']} after preprocessing), startup {startup['total']:.2f}s, "
+              f"max RSS {result['max_rss_mib']:.0f} MiB")
+        print(f"  {'stage':<24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+        for stage, summary in result["stages_ms"].items():
+            print(f"  {stage:<24} {summary['p50']:>9.3f} {summary['p95']:>9.3f} {summary['p99']:>9.3f} "
+                  f"{summary['mean']:>9.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of each recommendation serving stage")
+    parser.add_argument("--sizes", type=int, nargs="+", default=CATALOG_SIZES, help="synthetic catalog sizes")
+    parser.add_argument("--requests", type=int, default=REQUESTS)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--model", default="vae_model.pth")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results to compare this run against")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="only compare two saved result files")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        sys.exit(1 if compare_results(baseline, current, args.threshold) else 0)
+
+    results = {}
+    for size in args.sizes:
+        # A fresh process per size keeps the memory high-water marks independent
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+            results[str(size)] = pool.submit(benchmark_catalog, size, args.model, args.requests, args.top_n).result()
+    current = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "requests": args.requests,
+        "results": results,
+    }
+    print_results(results)
+    with open(args.out, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare_results(baseline, current, args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
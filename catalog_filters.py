@@ -0,0 +1,181 @@
+import numpy as np
+
+class SortedColumnIndex:
+    """Row ids ordered by the value of one numeric column, so a value range is two binary searches.
+
+    Rows whose value is NaN are left out, so they never match a range.
+    """
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        valid = np.flatnonzero(~np.isnan(values))
+        order = valid[np.argsort(values[valid], kind="stable")]
+        self.sorted_values = values[order]
+        self.row_ids = order
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def rows_between(self, low=None, high=None):
+        """Row ids with low <= value <= high (either bound may be None), in value order."""
+        start = 0 if low is None else np.searchsorted(self.sorted_values, low, side="left")
+        stop = len(self.sorted_values) if high is None else np.searchsorted(self.sorted_values, high, side="right")
+        return self.row_ids[start:max(start, stop)]
+
+class CatalogFilters:
+    """Hard filters over catalog columns, built once when the catalog is loaded.
+
+    columns maps a numeric column name to its value per row; categories maps a
+    categorical column name to (code per row, labels), with code -1 for no label.
+    candidates() resolves every active filter from these indexes and returns the
+    matching row ids, so a narrow query only ever scores a few rows.
+    """
+
+    def __init__(self, columns, categories=None):
+        self.values = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+        self.indexes = {name: SortedColumnIndex(values) for name, values in self.values.items()}
+        self.codes, self.postings = {}, {}
+        for name, (codes, labels) in (categories or {}).items():
+            codes = np.asarray(codes, dtype=np.int32)
+            self.codes[name] = (codes, list(labels))
+            # Row ids per label, in row order
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+            self.postings[name] = {label: order[bounds[i]:bounds[i + 1]] for i, label in enumerate(labels)}
+
+    def category_rows(self, name, labels):
+        postings = self.postings[name]
+        rows = [postings[label] for label in labels if label in postings]
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def candidates(self, ranges=None, categories=None):
+        """Sorted row ids that pass every filter, or None when no filter is active.
+
+        ranges maps a column to an inclusive (low, high) pair where either side may be
+        None; categories maps a categorical column to the labels to keep.
+        """
+        filters = [("range", name, bounds) for name, bounds in (ranges or {}).items()
+                   if bounds[0] is not None or bounds[1] is not None]
+        filters += [("category", name, labels) for name, labels in (categories or {}).items() if labels]
+        if not filters:
+            return None
+
+        # Every filter gives its rows with a binary search or a posting lookup; start from
+        # the smallest of those sets and check the other filters on just those rows
+        row_sets = [self.indexes[name].rows_between(*bounds) if kind == "range" else self.category_rows(name, bounds)
+                    for kind, name, bounds in filters]
+        smallest = int(np.argmin([len(rows) for rows in row_sets]))
+        rows = np.sort(row_sets[smallest])
+        for i, (kind, name, bounds) in enumerate(filters):
+            if i == smallest or len(rows) == 0:
+                continue
+            if kind == "range":
+                low, high = bounds
+                values = self.values[name][rows]
+                keep = ~np.isnan(values)
+                if low is not None:
+                    keep &= values >= low
+                if high is not None:
+                    keep &= values <= high
+            else:
+                codes, labels = self.codes[name]
+                wanted = [labels.index(label) for label in bounds if label in labels]
+                keep = np.isin(codes[rows], wanted)
+            rows = rows[keep]
+        return rows
+
+
+def bitset_rows(bitset, num_rows):
+    """Row ids of the set bits in a packed (np.packbits order) bitset."""
+    nonzero = np.flatnonzero(bitset)
+    if len(nonzero) * 8 > len(bitset):
+        return np.flatnonzero(np.unpackbits(bitset, count=num_rows))
+    # Sparse: only the bytes with a bit set are expanded
+    bits = np.unpackbits(bitset[nonzero]).reshape(-1, 8).astype(bool)
+    rows = (nonzero[:, None] * 8 + np.arange(8))[bits]
+    return rows[rows < num_rows]
+
+class GenreIndex:
+    """Each title's genres as one bitmask, plus a packed posting bitset per genre.
+
+    "Any of", "all of" and "exclude" constraints are ANDs and ORs of the posting
+    bitsets (one bit per title), and "at least k of" is a popcount over the masks,
+    so every constraint is a few vectorized passes over small arrays. The masks are
+    uint32, or uint64 past 32 genres; past 64 genres there are no masks and the
+    per-row checks read the posting bitsets instead.
+    """
+
+    def __init__(self, genre_flags, genres):
+        genre_flags = np.asarray(genre_flags, dtype=bool)
+        self.genres = list(genres)
+        self.num_rows = len(genre_flags)
+        self.postings = np.packbits(genre_flags.T, axis=1)
+        self.mask_dtype = np.uint32 if len(self.genres) <= 32 else np.uint64 if len(self.genres) <= 64 else None
+        self.masks = None
+        if self.mask_dtype is None:
+            print(f"Warning: {len(self.genres)} genres do not fit in a 64-bit mask; "
+                  "genre filters on a few rows fall back to the posting bitsets")
+            return
+        self.masks = np.zeros(self.num_rows, dtype=self.mask_dtype)
+        for bit in range(len(self.genres)):
+            self.masks[genre_flags[:, bit]] |= self.mask_dtype(1 << bit)
+
+    def bitmask(self, genres):
+        return sum(1 << self.genres.index(genre) for genre in set(genres) if genre in self.genres)
+
+    def _union(self, genres):
+        union = np.zeros(self.postings.shape[1], dtype=np.uint8)
+        for genre in set(genres):
+            if genre in self.genres:
+                union |= self.postings[self.genres.index(genre)]
+        return union
+
+    def genre_counts(self, rows, genres):
+        """How many of the given genres each of rows has."""
+        if self.masks is not None:
+            return np.bitwise_count(self.masks[rows] & self.mask_dtype(self.bitmask(genres)))
+        counts = np.zeros(len(rows), dtype=np.int64)
+        for genre in set(genres):
+            if genre in self.genres:
+                counts += (self.postings[self.genres.index(genre)][rows >> 3] >> (7 - (rows & 7))) & 1
+        return counts
+
+    def candidates(self, any_of=None, all_of=None, exclude=None, overlap=None, min_overlap=None, rows=None):
+        """Sorted row ids that satisfy every genre constraint given.
+
+        any_of keeps titles with at least one of those genres, all_of titles with all of
+        them, exclude drops titles with any of them, and min_overlap keeps titles with at
+        least that many of the overlap genres. When rows is given only those rows are
+        checked; with no constraint at all rows is returned as it is (None included).
+        """
+        if not any_of and not all_of and not exclude and not min_overlap:
+            return rows
+        if rows is not None:
+            # Few rows: count each row's genres directly instead of using whole-catalog bitsets
+            keep = np.ones(len(rows), dtype=bool)
+            if any_of:
+                keep &= self.genre_counts(rows, any_of) > 0
+            if all_of:
+                # A genre the catalog does not know is never counted, so no title has them all
+                keep &= self.genre_counts(rows, all_of) == len(set(all_of))
+            if exclude:
+                keep &= self.genre_counts(rows, exclude) == 0
+            rows = rows[keep]
+        else:
+            bitset = np.full(self.postings.shape[1], 0xFF, dtype=np.uint8)
+            if any_of:
+                bitset &= self._union(any_of)
+            for genre in set(all_of or ()):
+                if genre not in self.genres:
+                    bitset[:] = 0
+                    break
+                bitset &= self.postings[self.genres.index(genre)]
+            if exclude:
+                bitset &= ~self._union(exclude)
+            if min_overlap:
+                # At least one overlap genre is needed for any overlap at all
+                bitset &= self._union(overlap or ())
+            rows = bitset_rows(bitset, self.num_rows)
+        if min_overlap:
+            rows = rows[self.genre_counts(rows, overlap or ()) >= min_overlap]
+        return rows
@@ -0,0 +1,119 @@
+import ast
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+INGEST_CHUNK_SIZE = 200_000
+MIN_START_YEAR = 2000
+
+MOVIE_COLUMNS = ['tconst', 'primaryTitle', 'startYear', 'averageRating', 'numVotes', 'titleType', 'genres',
+                 'directorNames', 'writerNames', 'isAdult']
+MOVIE_NUMERICAL_COLUMNS = ['startYear', 'averageRating', 'numVotes']
+MOVIE_CATEGORICAL_COLUMNS = ['titleType', 'genres', 'directorNames', 'writerNames', 'isAdult']
+# Everything is read as text and converted per chunk, so malformed values become NaN instead of errors
+MOVIE_DTYPES = {column: str for column in MOVIE_COLUMNS}
+
+USER_COLUMNS = ['UserID', 'tconst', 'UserRating', 'FavoriteGenres', 'FavoriteDirectors', 'FavoriteActors',
+                'primaryTitle']
+USER_CATEGORICAL_COLUMNS = ['UserID', 'tconst', 'FavoriteGenres', 'FavoriteDirectors', 'FavoriteActors',
+                            'primaryTitle']
+USER_DTYPES = {column: str for column in USER_COLUMNS}
+
+class ValueCounts:
+    """Exact running median of a numeric column, in memory bounded by its number of distinct values."""
+
+    def __init__(self):
+        self.values = np.empty(0, dtype=np.float64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def add(self, column):
+        column = np.asarray(column, dtype=np.float64)
+        values, counts = np.unique(column[~np.isnan(column)], return_counts=True)
+        self.values, inverse = np.unique(np.concatenate([self.values, values]), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts])).astype(np.int64)
+
+    def median(self):
+        total = int(self.counts.sum())
+        if total == 0:
+            return np.nan
+        cumulative = np.cumsum(self.counts)
+        lower = self.values[np.searchsorted(cumulative, (total + 1) // 2)]
+        upper = self.values[np.searchsorted(cumulative, total // 2 + 1)]
+        return (lower + upper) / 2
+
+def parse_genre_list(value):
+    # Accepts "['Action', 'Drama']" as written by the data pipeline, and IMDb's "Action,Drama"
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return [genre.strip() for genre in value.split(',') if genre.strip() not in ('', 'Unknown', '\\N')]
+    if isinstance(parsed, (list, tuple)):
+        return [str(genre) for genre in parsed]
+    return [str(parsed)]
+
+def parse_genre_lists(values):
+    """Parse a column of genre-list strings without eval, once per distinct value."""
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    parsed = [parse_genre_list(value) for value in uniques]
+    return pd.Series([parsed[code] if code >= 0 else np.nan for code in codes], index=getattr(values, 'index', None),
+                     dtype=object)
+
+def concat_chunks(chunks, categorical_columns):
+    # Categories differ between chunks, so unify them instead of letting concat fall back to object
+    if not chunks:
+        return pd.DataFrame()
+    columns = {}
+    for column in chunks[0].columns:
+        if column in categorical_columns:
+            columns[column] = pd.Series(
+                union_categoricals([chunk[column] for chunk in chunks]),
+                index=pd.Index(np.concatenate([chunk.index.to_numpy() for chunk in chunks])),
+                name=column,
+            ).cat.remove_unused_categories()
+        else:
+            columns[column] = pd.concat([chunk[column] for chunk in chunks])
+    return pd.DataFrame(columns)
+
+def read_movie_data(path, chunksize=INGEST_CHUNK_SIZE):
+    """Stream cleaned_data.csv into compact columns, keeping only titles after MIN_START_YEAR.
+
+    Matches the in-memory pipeline: missing numbers are filled with the median of the
+    whole file, missing categories with 'Unknown'. Rows without a startYear are held
+    back until the median year is known.
+    """
+    medians = {column: ValueCounts() for column in MOVIE_NUMERICAL_COLUMNS}
+    chunks = []
+    for chunk in pd.read_csv(path, usecols=MOVIE_COLUMNS, dtype=MOVIE_DTYPES, chunksize=chunksize):
+        for column in MOVIE_NUMERICAL_COLUMNS:
+            chunk[column] = pd.to_numeric(chunk[column], errors='coerce').astype(np.float32)
+            medians[column].add(chunk[column])
+        chunk = chunk[~(chunk['startYear'] <= MIN_START_YEAR)].copy()
+        for column in MOVIE_CATEGORICAL_COLUMNS:
+            chunk[column] = chunk[column].fillna('Unknown').astype('category')
+        chunks.append(chunk)
+
+    data = concat_chunks(chunks, MOVIE_CATEGORICAL_COLUMNS)
+    if data.empty:
+        return pd.DataFrame(columns=MOVIE_COLUMNS)
+    for column in MOVIE_NUMERICAL_COLUMNS:
+        data[column] = data[column].fillna(np.float32(medians[column].median()))
+    data = data[data['startYear'] > MIN_START_YEAR].copy()
+    for column in MOVIE_CATEGORICAL_COLUMNS:
+        data[column] = data[column].cat.remove_unused_categories()
+    return data[MOVIE_COLUMNS]
+
+def read_user_data(path, chunksize=INGEST_CHUNK_SIZE):
+    """Stream user_data.csv into categorical text columns and a float32 UserRating."""
+    chunks = []
+    for chunk in pd.read_csv(path, usecols=USER_COLUMNS, dtype=USER_DTYPES, chunksize=chunksize):
+        chunk['UserRating'] = pd.to_numeric(chunk['UserRating'], errors='coerce').astype(np.float32)
+        for column in USER_CATEGORICAL_COLUMNS:
+            chunk[column] = chunk[column].astype('category')
+        chunks.append(chunk)
+    user_data = concat_chunks(chunks, USER_CATEGORICAL_COLUMNS)
+    if user_data.empty:
+        return pd.DataFrame(columns=USER_COLUMNS)
+    return user_data[USER_COLUMNS]
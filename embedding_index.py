@@ -0,0 +1,96 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+# Bump whenever the catalog preprocessing or the encoder input layout changes,
+# so previously persisted indexes are rebuilt instead of silently reused.
+EMBEDDING_INDEX_VERSION = 3
+HASH_CHUNK_SIZE = 1 << 20
+
+def atomic_write(path, writer, mode="wb"):
+    """Call writer(f) on a temporary file beside path, then rename it over path.
+
+    The rename is atomic, so a reader sees the old file or the complete new one, never a partial write.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode) as f:
+        writer(f)
+    os.replace(tmp_path, path)
+
+def embedding_index_path(model_path):
+    """The catalog's movie embeddings as computed by a model file, one row per title."""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}.embeddings.npz"
+
+def file_digest(path):
+    """SHA-256 of a file's contents, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def index_key(model_path, catalog_path, user_rating):
+    """Key identifying the embeddings produced by one model over one catalog."""
+    digest = hashlib.sha256()
+    digest.update(f"v{EMBEDDING_INDEX_VERSION}:{float(user_rating)!r}".encode())
+    digest.update(file_digest(model_path).encode())
+    digest.update(file_digest(catalog_path).encode())
+    return digest.hexdigest()
+
+def save_index(path, key, embeddings, tconsts):
+    atomic_write(path, lambda f: np.savez(
+        f,
+        key=np.array(key),
+        embeddings=np.ascontiguousarray(embeddings, dtype=np.float32),
+        tconst=np.asarray(tconsts, dtype=str),
+    ))
+
+def load_index(path, key, tconsts):
+    """Return the persisted embeddings, or None if missing, stale or misaligned."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as index:
+            if str(index["key"]) != key:
+                return None
+            if not np.array_equal(index["tconst"], np.asarray(tconsts, dtype=str)):
+                return None
+            return np.ascontiguousarray(index["embeddings"], dtype=np.float32)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable embedding index {path}: {e}")
+        return None
+
+def normalized_rows_path(model_path, key):
+    """Location of the L2-normalized float32 embeddings re-scored by the compact scorer."""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}.rows-{key[:16]}.npy"
+
+def save_normalized_rows(path, rows):
+    # A plain .npy so it can be memory-mapped; the key is part of the file name
+    atomic_write(path, lambda f: np.save(f, np.ascontiguousarray(rows, dtype=np.float32)))
+    root = path[:path.rindex(".rows-")]
+    for stale_path in glob.glob(f"{glob.escape(root)}.rows-*.npy"):
+        if stale_path != path:
+            os.remove(stale_path)
+
+def load_normalized_rows(path, num_rows):
+    """Memory-map the normalized rows, or None if missing or not the expected size."""
+    if not os.path.exists(path):
+        return None
+    try:
+        rows = np.load(path, mmap_mode="r")
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable embedding rows {path}: {e}")
+        return None
+    if rows.dtype != np.float32 or rows.ndim != 2 or len(rows) != num_rows:
+        return None
+    return rows
+
+if __name__ == "__main__":
+    # Offline build: loading the globals computes and persists the index
+    import vae_main
+    vae_main.initialize_globals()
+    print(f"Embedding index ready at {embedding_index_path(vae_main.MODEL_PATH)}")
@@ -1,9 +1,25 @@
-from flask import Flask, render_template_string, request, jsonify
-import pandas as pd
+import math
+import os
+import time
 
-from vae_main import run_for_frontend
+from flask import Flask, Response, request, jsonify
+
+from vae_main import run_for_frontend, recommend_batch, readiness
 from frontend_templates import genres
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Histogram
+from static_pages import StaticPage
+
+MAX_TOP_N = 50
+MAX_API_BATCH = 256
+# Optional hard filters, named as in the form and the JSON "filters" object
+FILTER_FIELDS = {"min_rating": float, "min_votes": int, "year_from": int, "year_to": int, "min_genre_overlap": int}
+LIST_FILTER_FIELDS = ["title_types", "genres_any", "genres_all", "genres_exclude"]
 
+# "success", "invalid" (rejected by validation) or "error" (raised while recommending), per query
+request_outcomes = Counter("recommendation_requests_total", "Recommendation queries by endpoint and outcome",
+                           ["endpoint", "outcome"])
+request_seconds = Histogram("recommendation_request_seconds", "Time to answer a recommendation request",
+                            ["endpoint"])
 
 app = Flask(__name__)  # Initialize the Flask app
 
@@ -409,6 +425,14 @@ main_page = '''
       <label class="section-title" for="votes_num">Number of Votes (0-1000):</label>
       <input class="input" type="number" id="votes_num" name="votes_num" min="0" max="1000" required>
     </div>
+    <details class="form-group">
+      <summary class="section-title" style="cursor:pointer;">Filters <span style="font-size:0.9em; color:#888;">(optional)</span></summary>
+      <input class="input" type="number" name="min_rating" step="0.1" min="0" max="10" placeholder="Min. rating">
+      <input class="input" type="number" name="min_votes" min="0" placeholder="Min. votes">
+      <input class="input" type="number" name="year_from" placeholder="From year">
+      <input class="input" type="number" name="year_to" placeholder="To year">
+      <input class="input" type="number" name="min_genre_overlap" min="0" placeholder="Min. selected genres per movie">
+    </details>
     <button class="submit-btn" type="submit">Get Recommendations</button>
     <a class="info-link" href="/info">More Information</a>
   </form>
@@ -603,8 +627,7 @@ output_page = '''
     {% endif %}
     {% if output is not none and output|length > 0 %}
       <div class="results-list">
-        {% for row in output.iterrows() %}
-          {% set rec = row[1] %}
+        {% for rec in output %}
           <div class="result-card">
             <div class="result-rank">{{ rec['Rank'] }}</div>
             <div class="result-info">
@@ -755,43 +778,198 @@ info_page = '''
 </html>
 '''
 
+# Templates are compiled once; / and /info do not depend on the request, so they are
+# also rendered once and served from memory
+main_template = app.jinja_env.from_string(main_page)
+output_template = app.jinja_env.from_string(output_page)
+info_template = app.jinja_env.from_string(info_page)
+PAGES_MODIFIED = max(os.path.getmtime(os.path.join(os.path.dirname(os.path.abspath(__file__)), name))
+                     for name in ("frontend.py", "frontend_templates.py"))
+rendered_main_page = StaticPage(main_template.render(genre_chunks=list(chunk_list(genres, 3))), PAGES_MODIFIED)
+rendered_info_page = StaticPage(info_template.render(), PAGES_MODIFIED)
+
 @app.route("/", methods=["GET"])
 def index():
-    return render_template_string(main_page, genre_chunks=list(chunk_list(genres, (n:=3))))
+    return rendered_main_page.response(request)
 
-@app.route("/output", methods=["POST"])
-def output():
-    output = pd.DataFrame()
+def validate_query(genres_selected, avg_rating, num_votes):
+    """Parse and check one query; returns (error_message, avg_rating, num_votes)."""
     error_message = None
-    genres_selected = request.form.getlist("genres")
-    avg_rating = request.form.get("avg_rating")
-    num_votes = request.form.get("votes_num")
     if not genres_selected:
         error_message = "You must select at least one genre."
+    # JSON bodies can carry true/false, NaN/Infinity and integers too large for a float
     try:
+        if isinstance(avg_rating, bool):
+            raise TypeError(avg_rating)
         avg_rating = float(avg_rating)
-        if not (0 <= avg_rating <= 10):
+        if not (0 <= avg_rating <= 10): # also false for NaN
             error_message = "Avg. Rating must be between 0 and 10."
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, OverflowError):
         error_message = "Invalid Avg. Rating input."
     try:
+        if isinstance(num_votes, bool):
+            raise TypeError(num_votes)
         num_votes = int(num_votes)
         if not (0 <= num_votes <= 1000):
             error_message = "Number of votes must be non-negative."
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, OverflowError):
         error_message = "Invalid Number of Votes input."
+    return error_message, avg_rating, num_votes
+
+def validate_filters(values, list_values):
+    """Parse the optional hard filters; returns (error_message, filters dict or None).
+
+    values holds the single-valued fields and list_values the list-valued ones.
+    """
+    filters = {}
+    for name, parse in FILTER_FIELDS.items():
+        value = values.get(name)
+        if value is None or value == "":
+            continue
+        try:
+            if isinstance(value, bool):
+                raise ValueError(value)
+            number = float(value)
+            # NaN would fail every comparison and quietly empty the filtered result
+            if not math.isfinite(number):
+                raise ValueError(value)
+            if parse is int:
+                if not number.is_integer():
+                    raise ValueError(value)
+                number = int(number)
+        except (ValueError, TypeError, OverflowError):
+            return f"Invalid {name} filter.", None
+        filters[name] = number
+    if "min_rating" in filters and not (0 <= filters["min_rating"] <= 10):
+        return "min_rating must be between 0 and 10.", None
+    if filters.get("min_votes", 0) < 0:
+        return "min_votes must be non-negative.", None
+    if filters.get("year_from", float("-inf")) > filters.get("year_to", float("inf")):
+        return "year_from must not be after year_to.", None
+    if filters.get("min_genre_overlap", 0) < 0:
+        return "min_genre_overlap must be non-negative.", None
+    for name in LIST_FILTER_FIELDS:
+        value = list_values.get(name)
+        if not value:
+            continue
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            return f"{name} must be a list of names.", None
+        unknown = [item for item in value if name != "title_types" and item not in genres]
+        if unknown:
+            return f"Unknown genre(s) in {name}: {', '.join(unknown)}", None
+        filters[name] = value
+    return None, (filters or None)
+
+def parse_api_query(item):
+    """Validate one JSON query; returns (error_message, query tuple for recommend_batch)."""
+    if not isinstance(item, dict):
+        return "Each query must be a JSON object.", None
+    genres_selected = item.get("genres")
+    if not isinstance(genres_selected, list) or not all(isinstance(g, str) for g in genres_selected):
+        return "genres must be a list of genre names.", None
+    unknown = [g for g in genres_selected if g not in genres]
+    if unknown:
+        return f"Unknown genre(s): {', '.join(unknown)}", None
+    error_message, avg_rating, num_votes = validate_query(genres_selected, item.get("avg_rating"), item.get("num_votes"))
+    if error_message:
+        return error_message, None
+    top_n = item.get("top_n", 5)
+    if isinstance(top_n, bool) or not isinstance(top_n, int) or not (1 <= top_n <= MAX_TOP_N):
+        return f"top_n must be an integer between 1 and {MAX_TOP_N}.", None
+    raw_filters = item.get("filters") or {}
+    if not isinstance(raw_filters, dict):
+        return "filters must be a JSON object.", None
+    error_message, filters = validate_filters(raw_filters, raw_filters)
+    if error_message:
+        return error_message, None
+    return None, (genres_selected, avg_rating, num_votes, top_n, filters)
+
+@app.route("/output", methods=["POST"])
+def output():
+    start = time.perf_counter()
+    output = []
+    genres_selected = request.form.getlist("genres")
+    error_message, avg_rating, num_votes = validate_query(
+        genres_selected, request.form.get("avg_rating"), request.form.get("votes_num")
+    )
+    filters = None
+    if not error_message:
+        error_message, filters = validate_filters(
+            request.form, {name: request.form.getlist(name) for name in LIST_FILTER_FIELDS}
+        )
     if not error_message:
         try:
-            output = run_for_frontend(genres_selected, avg_rating, num_votes)
+            output = run_for_frontend(genres_selected, avg_rating, num_votes, filters=filters)
         except Exception as e:
             error_message = f"Error generating recommendations: {str(e)}"
-    output_df = output if (not error_message and not output.empty) else None
-    return render_template_string(
-        output_page,
-        output=output_df,
+            request_outcomes.inc("output", "error")
+        else:
+            request_outcomes.inc("output", "success")
+    else:
+        request_outcomes.inc("output", "invalid")
+    page = output_template.render(
+        output=None if error_message else output,
         error_message=error_message
     )
+    request_seconds.observe(time.perf_counter() - start, "output")
+    return page
+
+@app.route("/api/recommend", methods=["POST"])
+def api_recommend():
+    """Accepts one query object or an array of them; invalid items get an error entry."""
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify(error="Request body must be JSON."), 400
+    items = payload if isinstance(payload, list) else [payload]
+    if len(items) > MAX_API_BATCH:
+        return jsonify(error=f"At most {MAX_API_BATCH} queries per request."), 400
+
+    start = time.perf_counter()
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        error_message, query = parse_api_query(item)
+        if error_message:
+            results[i] = {"error": error_message}
+        else:
+            valid.append((i, query))
+    request_outcomes.inc("api", "invalid", amount=len(items) - len(valid))
+    if valid:
+        try:
+            recommendations = recommend_batch([query for _, query in valid])
+        except Exception as e:
+            for i, _ in valid:
+                results[i] = {"error": f"Error generating recommendations: {str(e)}"}
+            request_outcomes.inc("api", "error", amount=len(valid))
+        else:
+            for (i, _), records in zip(valid, recommendations):
+                if isinstance(records, Exception):
+                    results[i] = {"error": f"Error generating recommendations: {str(records)}"}
+                    request_outcomes.inc("api", "error")
+                else:
+                    results[i] = {"recommendations": records}
+                    request_outcomes.inc("api", "success")
+
+    response = jsonify(results=results) if isinstance(payload, list) else jsonify(results[0])
+    request_seconds.observe(time.perf_counter() - start, "api")
+    return response
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify(status="ok")
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: the model, catalog and movie embeddings are loaded."""
+    state = readiness()
+    return jsonify(state), (200 if state["ready"] else 503)
+
+@app.route("/metrics")
+def metrics():
+    """Request, stage and startup metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route("/info")
 def info():
-    return render_template_string(info_page)
+    return rendered_info_page.response(request)
@@ -0,0 +1,166 @@
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+
+MOVIE_DATA_PATH = "data/cleaned_data.csv"
+USER_DATA_PATH = "data/user_data.csv"
+DEPTHS = [2, 3, 5]
+WIDTHS = [128, 512] # first hidden layer; each further layer is half as wide
+LATENT_DIMS = [5, 10]
+BATCH_SIZES = [64, 256]
+LEARNING_RATES = [1e-3]
+EPOCHS = 5
+HOLDOUT_FRACTION = 0.2 # rows kept out of training and used to compare every config
+LATENCY_REPEATS = 200 # single-query encoder calls timed per config
+SEED = 0
+
+# Worker state, set once per process by init_worker
+_x_input, _train_rows, _holdout_rows, _num_genres = None, None, None, None
+
+def hidden_dims(depth, width, latent_dim):
+    """[width, width/2, ...] with depth layers, never narrower than the latent layer."""
+    return [max(width >> i, latent_dim) for i in range(depth)]
+
+def sweep_configs(depths, widths, latent_dims, batch_sizes, learning_rates):
+    return [
+        {"depth": depth, "width": width, "latent_dim": latent_dim, "batch_size": batch_size,
+         "learning_rate": learning_rate, "hidden_dims": hidden_dims(depth, width, latent_dim)}
+        for depth, width, latent_dim, batch_size, learning_rate
+        in itertools.product(depths, widths, latent_dims, batch_sizes, learning_rates)
+    ]
+
+def init_worker(x_path, train_rows, holdout_rows, num_genres, num_threads):
+    global _x_input, _train_rows, _holdout_rows, _num_genres
+    import torch  # loaded first so that configure_worker_threads limits its thread pool too
+    from vae_main import configure_worker_threads
+    configure_worker_threads(num_threads)
+    _x_input = np.load(x_path, mmap_mode="r")
+    _train_rows, _holdout_rows, _num_genres = train_rows, holdout_rows, num_genres
+
+    # torch initializes lazily on the first training step (about 2s on CPU); pay that
+    # here so it is not charged to whichever config a worker happens to train first
+    from vae_network import VAE, train_vae
+    train_vae(_x_input[:8], epochs=1, batch_size=8, num_genres=num_genres,
+              vae=VAE(_x_input.shape[1], 8, 2), validation_fraction=0)
+
+def encoder_latency_us(vae, input_dim, repeats=LATENCY_REPEATS):
+    """Median time of one single-query pass through the NumPy encoder used for serving."""
+    from numpy_encoder import NumpyEncoder
+
+    encoder = NumpyEncoder.from_state_dict(vae.state_dict())
+    query = np.random.default_rng(SEED).random((1, input_dim), dtype=np.float32)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        encoder.mu(query)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1e6
+
+def run_config(config, epochs):
+    """Train one configuration and measure it; runs inside a worker process."""
+    import torch
+    from vae_network import DEVICE, VAE, evaluate_vae, feature_masks, train_vae
+
+    torch.manual_seed(SEED)
+    input_dim = _x_input.shape[1]
+    vae = VAE(input_dim, *config["hidden_dims"], config["latent_dim"])
+    start = time.perf_counter()
+    train_vae(_x_input[_train_rows], epochs=epochs, batch_size=config["batch_size"],
+              learning_rate=config["learning_rate"], num_genres=_num_genres, seed=SEED, vae=vae,
+              validation_fraction=0)
+    train_seconds = time.perf_counter() - start
+
+    # The VAE samples z even in eval mode, so fix the noise for a like-for-like comparison
+    torch.manual_seed(SEED)
+    holdout = torch.from_numpy(np.ascontiguousarray(_x_input[_holdout_rows], dtype=np.float32)).to(DEVICE)
+    val_loss = evaluate_vae(vae, holdout, *feature_masks(input_dim, _num_genres))
+
+    encoder_params = sum(p.numel() for p in vae.encoder.parameters())
+    return {
+        **config,
+        "val_loss": val_loss,
+        "train_seconds": train_seconds,
+        "encoder_us": encoder_latency_us(vae, input_dim),
+        "encoder_params": encoder_params,
+        "model_params": sum(p.numel() for p in vae.parameters()),
+        "encoder_kib": encoder_params * 4 / 1024,
+    }
+
+def pareto_front(results, objectives):
+    """Results that no other result beats or matches on every objective (all minimized)."""
+    def dominates(a, b):
+        return (all(a[key] <= b[key] for key in objectives)
+                and any(a[key] < b[key] for key in objectives))
+    return [r for r in results if not any(dominates(other, r) for other in results if other is not r)]
+
+def print_table(results, front):
+    header = (f"{'':1} {'hidden_dims':<24} {'latent':>6} {'batch':>5} {'lr':>8} {'val_loss':>9} "
+              f"{'train_s':>8} {'enc_us':>7} {'enc_KiB':>8} {'params':>8}")
+    print(header)
+    for r in sorted(results, key=lambda r: r["val_loss"]):
+        marker = "*" if r in front else ""
+        print(f"{marker:1} {str(r['hidden_dims']):<24} {r['latent_dim']:>6} {r['batch_size']:>5} "
+              f"{r['learning_rate']:>8.0e} {r['val_loss']:>9.4f} {r['train_seconds']:>8.1f} "
+              f"{r['encoder_us']:>7.1f} {r['encoder_kib']:>8.1f} {r['model_params']:>8}")
+    print("* Pareto-optimal on val_loss, encoder latency and encoder size")
+
+def main():
+    parser = argparse.ArgumentParser(description="Train VAE configurations in parallel and compare them")
+    parser.add_argument("--depths", type=int, nargs="+", default=DEPTHS)
+    parser.add_argument("--widths", type=int, nargs="+", default=WIDTHS)
+    parser.add_argument("--latent-dims", type=int, nargs="+", default=LATENT_DIMS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--learning-rates", type=float, nargs="+", default=LEARNING_RATES)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--max-rows", type=int, help="train on a random sample of this many rows")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="configs trained at once")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--out", default="sweep_results.json")
+    args = parser.parse_args()
+
+    from train_save_model import load_training_data
+    training = load_training_data(MOVIE_DATA_PATH, USER_DATA_PATH)
+    x_input = np.ascontiguousarray(training["x_input"], dtype=np.float32)
+    rng = np.random.default_rng(SEED)
+    rows = rng.permutation(len(x_input))
+    if args.max_rows is not None:
+        rows = rows[:args.max_rows]
+    holdout_size = int(HOLDOUT_FRACTION * len(rows))
+    holdout_rows, train_rows = np.sort(rows[:holdout_size]), np.sort(rows[holdout_size:])
+
+    configs = sweep_configs(args.depths, args.widths, args.latent_dims, args.batch_sizes, args.learning_rates)
+    print(f"Sweeping {len(configs)} configs on {len(train_rows)} rows ({len(holdout_rows)} held out) "
+          f"with {args.workers} workers x {args.threads_per_worker} threads")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Workers memory-map the matrix instead of each receiving a pickled copy
+        x_path = os.path.join(tmp_dir, "x_input.npy")
+        np.save(x_path, x_input)
+        # spawn, not fork (see vae_main.configure_worker_threads)
+        with ProcessPoolExecutor(args.workers, mp_context=get_context("spawn"), initializer=init_worker,
+                                 initargs=(x_path, train_rows, holdout_rows, len(training["genre_list"]),
+                                           args.threads_per_worker)) as pool:
+            futures = [pool.submit(run_config, config, args.epochs) for config in configs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"[{len(results)}/{len(configs)}] {result['hidden_dims']} latent={result['latent_dim']} "
+                      f"batch={result['batch_size']}: val_loss {result['val_loss']:.4f} "
+                      f"in {result['train_seconds']:.1f}s")
+
+    front = pareto_front(results, ["val_loss", "encoder_us", "encoder_params"])
+    print_table(results, front)
+    with open(args.out, "w") as f:
+        json.dump({"results": results, "pareto": front}, f, indent=2)
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+from frontend_templates import genres as GENRES
+
+CLIENTS = 8 # concurrent closed-loop clients; each sends its next request as soon as the last one returns
+DURATION = 30.0 # seconds of load
+INTERVAL = 1.0 # seconds per row of the time series
+ROUTE_MIX = "output=8,index=1,info=1" # relative weight of each route in the replayed traffic
+DISTINCT_QUERIES = 1000 # size of the query pool; smaller pools repeat queries (and hit the result cache) more
+REQUEST_TIMEOUT = 120.0 # seconds; a cold server can take this long to answer its first queries
+CONNECT_RETRY_DELAY = 0.05 # seconds a client waits after a refused connection while the server starts
+PERCENTILES = [50, 95, 99]
+SEED = 0
+
+# route name -> (method, path)
+ROUTES = {
+    "index": ("GET", "/"),
+    "info": ("GET", "/info"),
+    "output": ("POST", "/output"),
+    "api": ("POST", "/api/recommend"),
+}
+
+def parse_mix(text):
+    """"output=8,index=1" -> ({route: probability}) over the named routes."""
+    weights = {}
+    for part in text.split(","):
+        route, _, weight = part.partition("=")
+        route = route.strip()
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route {route!r}; choose from {', '.join(ROUTES)}")
+        weights[route] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("The route mix needs at least one positive weight")
+    return {route: weight / total for route, weight in weights.items() if weight > 0}
+
+def make_queries(rng, count):
+    """Query pool like the main page submits: 1-3 genres, a rating and an integer vote count."""
+    queries = []
+    for _ in range(count):
+        selected = rng.choice(len(GENRES), size=rng.integers(1, 4), replace=False)
+        queries.append({"genres": [GENRES[i] for i in sorted(selected)],
+                        "avg_rating": float(rng.integers(0, 101)) / 10,
+                        "num_votes": int(rng.integers(0, 1001))})
+    return queries
+
+def build_request(route, query):
+    """(method, path, body, content_type) for one request."""
+    method, path = ROUTES[route]
+    if route == "output":
+        form = {"genres": query["genres"], "avg_rating": query["avg_rating"], "votes_num": query["num_votes"]}
+        return method, path, urlencode(form, doseq=True).encode(), "application/x-www-form-urlencoded"
+    if route == "api":
+        return method, path, json.dumps(query).encode(), "application/json"
+    return method, path, None, None
+
+def succeeded(route, status, body):
+    # /output reports failures on a 200 page, so look for the results table (or the
+    # message for a query that legitimately matched nothing) instead
+    if status != 200:
+        return False
+    if route == "output":
+        return b"Similarity Score" in body or b"No recommendations found" in body
+    if route == "api":
+        return b'"error"' not in body
+    return True
+
+class TestClientTransport:
+    """Sends requests through Flask's test client, in this process."""
+
+    __test__ = False # a transport, not a test case for pytest to collect
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, method, path, body, content_type):
+        response = self.client.open(path, method=method, data=body, content_type=content_type)
+        return response.status_code, response.get_data()
+
+class HTTPTransport:
+    """Sends requests to a running server over one keep-alive connection per client."""
+
+    def __init__(self, url, timeout=REQUEST_TIMEOUT):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.connection = None
+
+    def send(self, method, path, body, content_type):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {} if content_type is None else {"Content-Type": content_type}
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+
+def run_client(transport, mix, queries, seed, start, deadline, records):
+    """Closed loop: send, wait for the answer, record it, repeat until the deadline."""
+    rng = np.random.default_rng(seed)
+    routes, probabilities = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        route = routes[rng.choice(len(routes), p=probabilities)]
+        request = build_request(route, queries[rng.integers(len(queries))])
+        sent = time.perf_counter()
+        try:
+            status, body = transport.send(*request)
+            ok = succeeded(route, status, body)
+        except Exception:
+            status, ok = 0, False
+        done = time.perf_counter()
+        records.append((sent - start, done - start, route, status, ok))
+        if status == 0:
+            # Refused or dropped: the server may still be starting
+            time.sleep(CONNECT_RETRY_DELAY)
+
+def read_proc_cpu_seconds(pid):
+    """utime + stime of one process from /proc, or None if it is gone (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def process_tree_cpu_seconds(pid):
+    """CPU seconds of pid and its direct children (prefork workers), read from /proc."""
+    total = read_proc_cpu_seconds(pid) or 0.0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if parent == pid:
+            total += read_proc_cpu_seconds(int(entry)) or 0.0
+    return total
+
+def own_cpu_seconds():
+    times = os.times()
+    return times.user + times.system
+
+def sample_cpu(cpu_seconds, start, stop, interval, samples):
+    while not stop.wait(interval):
+        samples.append((time.perf_counter() - start, cpu_seconds()))
+
+def latency_summary(latencies):
+    if len(latencies) == 0:
+        return {}
+    ms = np.asarray(latencies) * 1000
+    summary = {f"p{p}": float(np.percentile(ms, p)) for p in PERCENTILES}
+    summary.update(mean=float(ms.mean()), max=float(ms.max()))
+    return summary
+
+def summarize(records, duration):
+    sent, done = np.array([r[0] for r in records]), np.array([r[1] for r in records])
+    ok = np.array([r[4] for r in records], dtype=bool)
+    latency = done - sent
+    summary = {"requests": len(records), "errors": int((~ok).sum()),
+               "error_rate": float((~ok).mean()) if len(records) else 0.0,
+               "throughput_rps": float(ok.sum() / duration) if duration > 0 else 0.0,
+               "latency_ms": latency_summary(latency[ok])}
+    # Status 0 means no HTTP answer at all (refused, reset or timed out)
+    statuses = [r[3] for r in records]
+    summary["statuses"] = {str(status): statuses.count(status) for status in sorted(set(statuses))}
+    routes = sorted({r[2] for r in records})
+    summary["routes"] = {}
+    for route in routes:
+        mask = np.array([r[2] == route for r in records])
+        summary["routes"][route] = {"requests": int(mask.sum()), "errors": int((mask & ~ok).sum()),
+                                    "latency_ms": latency_summary(latency[mask & ok])}
+    return summary
+
+def time_series(records, cpu_samples, duration, interval):
+    """Per-interval completions, throughput, latency, errors and CPU use (in cores)."""
+    done = np.array([r[1] for r in records])
+    latency = done - np.array([r[0] for r in records])
+    ok = np.array([r[4] for r in records], dtype=bool)
+    cpu_times = np.array([t for t, _ in cpu_samples])
+    cpu_values = np.array([c for _, c in cpu_samples])
+    rows = []
+    for start in np.arange(0, duration, interval):
+        end = min(start + interval, duration)
+        mask = (done >= start) & (done < end)
+        row = {"start": float(start), "completed": int(mask.sum()), "errors": int((mask & ~ok).sum()),
+               "throughput_rps": float((mask & ok).sum() / (end - start)),
+               "latency_ms": latency_summary(latency[mask & ok]), "cpu_cores": None}
+        if len(cpu_times) >= 2:
+            # Cumulative CPU seconds interpolated at both ends of the interval
+            used = np.interp(end, cpu_times, cpu_values) - np.interp(start, cpu_times, cpu_values)
+            row["cpu_cores"] = float(used / (end - start))
+        rows.append(row)
+    return rows
+
+def cold_start(records):
+    """Seconds until the first successful answer on each route, from the start of the run."""
+    first = {}
+    for _, done, route, _, ok in sorted(records, key=lambda r: r[1]):
+        if ok and route not in first:
+            first[route] = done
+    return first
+
+def print_report(result):
+    print(f"\n{'t (s)':>6} {'done':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>6} {'cpu':>6}")
+    for row in result["time_series"]:
+        latency = row["latency_ms"]
+        cpu = "" if row["cpu_cores"] is None else f"{row['cpu_cores']:.0%}"
+        print(f"{row['start']:>6.1f} {row['completed']:>6} {row['throughput_rps']:>8.1f} "
+              f"{latency.get('p50', float('nan')):>9.1f} {latency.get('p95', float('nan')):>9.1f} "
+              f"{row['errors']:>6} {cpu:>6}")
+
+    for name in ("overall", "steady_state"):
+        summary = result[name]
+        if summary is None:
+            continue
+        latency = summary["latency_ms"]
+        statuses = ", ".join(f"{status}: {count}" for status, count in summary["statuses"].items())
+        print(f"\n{name}: {summary['requests']} requests, {summary['throughput_rps']:.1f} req/s, "
+              f"{summary['error_rate']:.1%} errors (HTTP status {statuses}; 0 is no answer)")
+        print(f"  {'route':<8} {'requests':>8} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for route, stats in summary["routes"].items():
+            latency = stats["latency_ms"]
+            print(f"  {route:<8} {stats['requests']:>8} {stats['errors']:>6} "
+                  + " ".join(f"{latency.get(key, float('nan')):>9.1f}" for key in ("p50", "p95", "p99", "max")))
+    print("\nfirst success after " + ", ".join(f"{route} {seconds:.2f}s"
+                                               for route, seconds in result["first_success_seconds"].items()))
+
+def start_server(bind, mode, workers, preload):
+    """Launch website.py as a child process; the load starts while it is still loading."""
+    website = os.path.join(os.path.dirname(os.path.abspath(__file__)), "website.py")
+    command = [sys.executable, website, "--bind", bind, "--mode", mode,
+               "--preload" if preload else "--no-preload"]
+    if mode == "prefork":
+        command += ["--workers", str(workers)]
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def run_load(transports, mix, queries, duration, interval, cpu_seconds):
+    records_per_client = [[] for _ in transports]
+    samples = []
+    stop = threading.Event()
+    start = time.perf_counter()
+    samples.append((0.0, cpu_seconds()))
+    sampler = threading.Thread(target=sample_cpu, args=(cpu_seconds, start, stop, interval / 4, samples),
+                               daemon=True)
+    sampler.start()
+    clients = [threading.Thread(target=run_client,
+                                args=(transport, mix, queries, SEED + 1 + i, start, start + duration, records),
+                                daemon=True)
+               for i, (transport, records) in enumerate(zip(transports, records_per_client))]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    samples.append((elapsed, cpu_seconds()))
+    return [r for records in records_per_client for r in records], samples, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Closed-loop concurrent load test of the Flask app")
+    parser.add_argument("--clients", type=int, default=CLIENTS)
+    parser.add_argument("--duration", type=float, default=DURATION, help="seconds")
+    parser.add_argument("--interval", type=float, default=INTERVAL, help="seconds per time-series row")
+    parser.add_argument("--mix", default=ROUTE_MIX, help=f"route weights from {', '.join(ROUTES)}")
+    parser.add_argument("--distinct-queries", type=int, default=DISTINCT_QUERIES)
+    parser.add_argument("--url", help="load a running server instead of the app in this process")
+    parser.add_argument("--start-server", action="store_true",
+                        help="start website.py on --bind and load it from its first second")
+    parser.add_argument("--bind", default="127.0.0.1:8099", help="address for --start-server")
+    parser.add_argument("--mode", choices=["dev", "prefork"], default="dev", help="website.py mode for --start-server")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="prefork workers for --start-server")
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=True,
+                        help="website.py --preload for --start-server")
+    parser.add_argument("--server-pid", type=int, help="pid of the --url server, to report its CPU use")
+    parser.add_argument("--warm", action="store_true",
+                        help="in-process only: load the model before the clock starts (default: cold start)")
+    parser.add_argument("--out", default="load_test_results.json")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    queries = make_queries(np.random.default_rng(SEED), args.distinct_queries)
+    server = None
+    if args.start_server:
+        server = start_server(args.bind, args.mode, args.workers, args.preload)
+        args.url = f"http://{args.bind}"
+        args.server_pid = server.pid
+
+    if args.url:
+        target = args.url
+        transports = [HTTPTransport(args.url) for _ in range(args.clients)]
+        if args.server_pid is not None:
+            cpu_seconds, cpu_of = (lambda: process_tree_cpu_seconds(args.server_pid)), "server"
+        else:
+            cpu_seconds, cpu_of = own_cpu_seconds, "load generator"
+    else:
+        # The clients share this process with the app, so CPU includes their own overhead
+        from frontend import app
+        target = "in-process test client"
+        if args.warm:
+            from vae_main import ensure_initialized
+            ensure_initialized()
+        transports = [TestClientTransport(app) for _ in range(args.clients)]
+        cpu_seconds, cpu_of = own_cpu_seconds, "app and load generator"
+
+    print(f"Loading {target} with {args.clients} clients for {args.duration:.0f}s "
+          f"(mix {args.mix}, {len(queries)} distinct queries, CPU of the {cpu_of}, {os.cpu_count()} cores)")
+    try:
+        records, cpu_samples, elapsed = run_load(transports, mix, queries, args.duration, args.interval, cpu_seconds)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    first_success = cold_start(records)
+    # Steady state starts once every route in the mix has answered successfully
+    warm_at = max(first_success.values()) if len(first_success) == len(mix) else None
+    steady = None
+    if warm_at is not None and warm_at < elapsed:
+        steady = summarize([r for r in records if r[0] >= warm_at], elapsed - warm_at)
+    result = {
+        "target": target,
+        "clients": args.clients,
+        "mix": mix,
+        "distinct_queries": len(queries),
+        "duration_seconds": elapsed,
+        "cpu_of": cpu_of,
+        "cpu_count": os.cpu_count(),
+        "first_success_seconds": first_success,
+        "overall": summarize(records, elapsed),
+        "steady_state": steady,
+        "time_series": time_series(records, cpu_samples, elapsed, args.interval),
+    }
+    print_report(result)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
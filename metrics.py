@@ -0,0 +1,257 @@
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from embedding_index import atomic_write
+
+# Upper bounds in seconds; a stage of this app takes anywhere from ~50us to a few seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+FLUSH_INTERVAL = 1.0 # seconds between a process's metric snapshots in multi-process mode
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Metric:
+    """Base for metrics with a fixed set of label names; one child value per label combination.
+
+    Recording only touches a dict entry under a lock, and the text exposition is built
+    when /metrics is scraped, so an unscraped metric costs next to nothing.
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _check_labels(self, labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labelvalues}")
+
+    def snapshot(self):
+        """{labelvalues: value} as of now, safe to keep while recording continues."""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, snapshots):
+        """One snapshot combining the snapshots of several processes."""
+        raise NotImplementedError
+
+    def samples(self, values):
+        """(suffix, labelvalues, extra labels, value) for every sample, in a stable order."""
+        raise NotImplementedError
+
+    def render(self, values=None):
+        values = self.snapshot() if values is None else values
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labelvalues, extra, value in self.samples(values):
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, labelvalues, extra)} "
+                         f"{format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """Monotonic count; by convention the name ends in _total."""
+
+    type_name = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        self._check_labels(labelvalues)
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def merge(self, snapshots):
+        # Counts from every process that ever ran, so the total never goes backwards
+        merged = {}
+        for snapshot in snapshots:
+            for labelvalues, value in snapshot.items():
+                merged[labelvalues] = merged.get(labelvalues, 0) + value
+        return merged
+
+    def samples(self, values):
+        return [("", labelvalues, (), value) for labelvalues, value in sorted(values.items())]
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value, *labelvalues):
+        self._check_labels(labelvalues)
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues)
+
+    def merge(self, snapshots):
+        # The gauges here describe the loaded model and catalog, which every worker shares
+        merged = {}
+        for snapshot in snapshots:
+            for labelvalues, value in snapshot.items():
+                merged[labelvalues] = max(merged.get(labelvalues, value), value)
+        return merged
+
+    def samples(self, values):
+        return [("", labelvalues, (), value) for labelvalues, value in sorted(values.items())]
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram of observed values (seconds for the latency metrics here)."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labelvalues):
+        self._check_labels(labelvalues)
+        # Per-bucket counts are kept non-cumulative and summed up at scrape time
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._values.get(labelvalues)
+            if child is None:
+                child = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            child[0][index] += 1
+            child[1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def count(self, *labelvalues):
+        child = self._values.get(labelvalues)
+        return 0 if child is None else sum(child[0])
+
+    def snapshot(self):
+        with self._lock:
+            return {labelvalues: [list(counts), total] for labelvalues, (counts, total) in self._values.items()}
+
+    def merge(self, snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for labelvalues, (counts, total) in snapshot.items():
+                child = merged.setdefault(labelvalues, [[0] * len(counts), 0.0])
+                child[0] = [a + b for a, b in zip(child[0], counts)]
+                child[1] += total
+        return merged
+
+    def samples(self, values):
+        samples = []
+        for labelvalues, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(("_bucket", labelvalues, [("le", format_value(float(bound)))], cumulative))
+            samples.append(("_sum", labelvalues, (), total))
+            samples.append(("_count", labelvalues, (), cumulative))
+        return samples
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Registry:
+    """The metrics of one process, or with enable_multiprocess of every process sharing a directory.
+
+    In multi-process mode each process writes a snapshot of its values to the
+    directory every FLUSH_INTERVAL seconds, and whichever process is scraped merges
+    all of them: counters and histograms are summed over every process that has
+    run, including exited ones, so they never reset; gauges come from live processes.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._directory = None
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def enable_multiprocess(self, directory, flush_interval=FLUSH_INTERVAL):
+        """Share this process's metrics through directory; call after fork, in each process."""
+        self._directory = directory
+        self.write_snapshot()
+        thread = threading.Thread(target=self._flush_loop, args=(flush_interval,), name="metrics-flush", daemon=True)
+        thread.start()
+
+    def _flush_loop(self, flush_interval):
+        while True:
+            time.sleep(flush_interval)
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {metric.name: [[list(labelvalues), value] for labelvalues, value in metric.snapshot().items()]
+                    for metric in metrics}
+        path = os.path.join(self._directory, f"metrics-{os.getpid()}.json")
+        atomic_write(path, lambda f: json.dump(snapshot, f), mode="w")
+
+    def read_snapshots(self):
+        """(pid, {metric name: {labelvalues: value}}) for every process that wrote a snapshot."""
+        snapshots = []
+        for path in glob.glob(os.path.join(self._directory, "metrics-*.json")):
+            try:
+                pid = int(os.path.basename(path)[len("metrics-"):-len(".json")])
+                with open(path) as f:
+                    raw = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((pid, {name: {tuple(labelvalues): value for labelvalues, value in values}
+                                    for name, values in raw.items()}))
+        return snapshots
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        if self._directory is None:
+            return "".join(metric.render() + "\n" for metric in metrics)
+
+        self.write_snapshot()
+        snapshots = self.read_snapshots()
+        live = [values for pid, values in snapshots if pid == os.getpid() or process_alive(pid)]
+        rendered = []
+        for metric in metrics:
+            sources = live if isinstance(metric, Gauge) else [values for _, values in snapshots]
+            rendered.append(metric.render(metric.merge(values.get(metric.name, {}) for values in sources)) + "\n")
+        return "".join(rendered)
+
+REGISTRY = Registry()
@@ -0,0 +1,95 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """Groups items submitted by concurrent threads into batches for one call to process_batch.
+
+    A batch is dispatched as soon as no other submitter is queued or about to queue,
+    so a request that arrives alone never waits; otherwise it waits up to max_wait
+    seconds for those submitters, and closes early at max_batch_size items.
+    process_batch receives the list of items and must return one result per item,
+    in order; a result that is an exception is raised to that item's submitter only.
+    """
+
+    def __init__(self, process_batch, max_batch_size=64, max_wait=0.002):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # Submitters whose item is queued or about to be, and not yet taken into a batch
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def submit(self, item):
+        """Queue an item and block until its batch has been processed."""
+        self._ensure_worker()
+        future = Future()
+        with self._pending_lock:
+            self._pending += 1
+        self._queue.put((item, future))
+        return future.result()
+
+    def _take(self, timeout=None):
+        entry = self._queue.get(timeout=timeout)
+        with self._pending_lock:
+            self._pending -= 1
+        return entry
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so a forked worker process starts its own
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive() or self._worker_pid != os.getpid():
+                if self._worker_pid != os.getpid():
+                    self._queue = queue.Queue()
+                    self._pending_lock = threading.Lock()
+                    self._pending = 0
+                self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._take()]
+        deadline = time.monotonic() + self.max_wait
+        # Only wait while another submitter has announced an item
+        while len(batch) < self.max_batch_size and self._pending > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._take(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            results = list(results)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            # A short result list must not leave submitters blocked forever
+            for _, future in batch[len(results):]:
+                future.set_exception(RuntimeError(
+                    f"process_batch returned {len(results)} results for {len(batch)} items"))
@@ -0,0 +1,111 @@
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+from embedding_index import atomic_write, file_digest
+
+HIDDEN_LAYER_PATTERN = re.compile(r"^encoder\.fc(\d+)\.weight$")
+
+def encoder_weights_path(model_path):
+    """A model file's encoder layers as plain numpy arrays, for inference without torch."""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}.encoder.npz"
+
+def encoder_params(state_dict):
+    """{layer: (weight, bias)} for the encoder layers of a VAE state dict, in forward order.
+
+    Weights are float32 arrays stored as (in, out), so inference is x @ weight + bias.
+    """
+    hidden = sorted((int(match.group(1)) for match in map(HIDDEN_LAYER_PATTERN.match, state_dict) if match))
+    layers = [f"fc{i}" for i in hidden] + ["fc_mu", "fc_log_var"]
+    return {
+        layer: (state_dict[f"encoder.{layer}.weight"].detach().cpu().numpy().T.astype(np.float32),
+                state_dict[f"encoder.{layer}.bias"].detach().cpu().numpy().astype(np.float32))
+        for layer in layers
+    }
+
+def export_encoder_weights(model_path, out_path=None):
+    """Dump the encoder half of a saved VAE state dict into a plain .npz (needs torch)."""
+    import torch
+
+    out_path = encoder_weights_path(model_path) if out_path is None else out_path
+    params = encoder_params(torch.load(model_path, map_location="cpu"))
+
+    arrays = {
+        "layers": np.array(json.dumps(list(params))),
+        "source_digest": np.array(file_digest(model_path)),
+    }
+    for layer, (weight, bias) in params.items():
+        arrays[f"{layer}.weight"] = weight
+        arrays[f"{layer}.bias"] = bias
+
+    atomic_write(out_path, lambda f: np.savez(f, **arrays))
+    return out_path
+
+class NumpyEncoder:
+    """NumPy implementation of Encoder.forward: ReLU hidden layers, then the mu / log_var heads."""
+
+    def __init__(self, hidden_layers, mu_layer, log_var_layer):
+        self.hidden_layers = [(np.ascontiguousarray(w), b) for w, b in hidden_layers]
+        self.mu_layer = (np.ascontiguousarray(mu_layer[0]), mu_layer[1])
+        self.log_var_layer = (np.ascontiguousarray(log_var_layer[0]), log_var_layer[1])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as weights:
+            layers = json.loads(str(weights["layers"]))
+            params = {layer: (weights[f"{layer}.weight"], weights[f"{layer}.bias"]) for layer in layers}
+        hidden = [params[layer] for layer in layers if layer not in ("fc_mu", "fc_log_var")]
+        return cls(hidden, params["fc_mu"], params["fc_log_var"])
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        params = encoder_params(state_dict)
+        hidden = [params[layer] for layer in params if layer not in ("fc_mu", "fc_log_var")]
+        return cls(hidden, params["fc_mu"], params["fc_log_var"])
+
+    @property
+    def in_features(self):
+        return self.hidden_layers[0][0].shape[0]
+
+    def _hidden(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        for weight, bias in self.hidden_layers:
+            x = x @ weight
+            x += bias
+            np.maximum(x, 0, out=x)
+        return x
+
+    def mu(self, x):
+        weight, bias = self.mu_layer
+        return self._hidden(x) @ weight + bias
+
+    def forward(self, x):
+        h = self._hidden(x)
+        return h @ self.mu_layer[0] + self.mu_layer[1], h @ self.log_var_layer[0] + self.log_var_layer[1]
+
+    __call__ = forward
+
+def encoder_export_current(model_path):
+    """Whether the exported encoder exists and was exported from the model file as it is now."""
+    path = encoder_weights_path(model_path)
+    if not os.path.exists(path):
+        return False
+    with np.load(path, allow_pickle=False) as weights:
+        return str(weights["source_digest"]) == file_digest(model_path)
+
+def load_numpy_encoder(model_path):
+    """Load the exported encoder, re-exporting it first if it is missing or older than the model."""
+    path = encoder_weights_path(model_path)
+    if encoder_export_current(model_path):
+        return NumpyEncoder.load(path)
+    print(f"Exporting encoder weights from {model_path} to {path}")
+    export_encoder_weights(model_path, path)
+    return NumpyEncoder.load(path)
+
+if __name__ == "__main__":
+    model_path = sys.argv[1] if len(sys.argv) > 1 else "vae_model.pth"
+    print(f"Encoder weights written to {export_encoder_weights(model_path)}")
@@ -0,0 +1,100 @@
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+LISTEN_BACKLOG = 1024
+RESPAWN_DELAY = 1.0 # seconds to wait before replacing a worker that died
+
+def parse_bind(bind, default_port):
+    """Split "host:port" (or just "host") into its parts."""
+    if ":" not in bind:
+        return bind or "0.0.0.0", default_port
+    host, _, port = bind.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+def listen_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(app, host, port, sock, worker_init):
+    # Children exit on SIGTERM/SIGINT like any process; only the parent coordinates shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if worker_init is not None:
+        worker_init()
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+def spawn_worker(app, host, port, sock, worker_init):
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            run_worker(app, host, port, sock, worker_init)
+        except BaseException as e:
+            print(f"Worker {os.getpid()} exiting: {e!r}", file=sys.stderr)
+            status = 1
+        finally:
+            os._exit(status)
+    return pid
+
+def serve_prefork(app, host, port, workers, preload=None, worker_init=None):
+    """Serve app from `workers` forked processes that share one listening socket.
+
+    preload runs once in the parent before forking, so everything it loads is shared
+    copy-on-write by the workers. worker_init runs in each worker right after the fork.
+    """
+    sock = listen_socket(host, port)
+    if preload is not None:
+        start = time.perf_counter()
+        preload()
+        print(f"Preloaded in {time.perf_counter() - start:.2f}s")
+    # Move everything loaded so far out of the collector's reach, so that
+    # collections in the workers do not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        pid = spawn_worker(app, host, port, sock, worker_init)
+        children[pid] = time.monotonic()
+    print(f"Serving on http://{host}:{port} with {workers} workers: {sorted(children)}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.pop(pid, None)
+        if stopping:
+            continue
+        print(f"Worker {pid} exited with status {status}; starting a replacement", file=sys.stderr)
+        time.sleep(RESPAWN_DELAY)
+        new_pid = spawn_worker(app, host, port, sock, worker_init)
+        children[new_pid] = time.monotonic()
+    sock.close()
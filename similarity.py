@@ -0,0 +1,167 @@
+import threading
+
+import numpy as np
+
+# Upper bound on the scores held at once when a batch of queries is scored together
+BATCH_SCORE_ELEMENTS = 1 << 24
+EMBEDDING_PRECISIONS = ("float16", "int8")
+QUANTIZED_BLOCK_ROWS = 1 << 16 # compact rows widened to float32 at a time while scoring
+SCORE_SLACK = 1e-5 # added to the quantization error bound to cover float32 rounding
+# Filtered queries with at most this fraction of the catalog as candidates read only
+# those rows; broader ones scan the whole matrix and pick the candidates' scores
+CANDIDATE_GATHER_FRACTION = 0.25
+
+def normalize_rows(matrix):
+    """L2-normalize each row as float32; all-zero rows stay zero like sklearn's cosine_similarity."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first, without sorting the whole array."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, len(scores) - k)[len(scores) - k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+def row_blocks(num_rows, block_rows=QUANTIZED_BLOCK_ROWS):
+    for start in range(0, num_rows, block_rows):
+        yield slice(start, min(start + block_rows, num_rows))
+
+def quantize_rows(matrix, precision):
+    """Compact copy of matrix as (codes, per-dimension scales, per-dimension worst-case error).
+
+    codes * scales reconstructs matrix to within error in every dimension.
+    """
+    if precision == "float16":
+        codes = np.empty(matrix.shape, dtype=np.float16)
+        scales = np.ones(matrix.shape[1], dtype=np.float32)
+    elif precision == "int8":
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.zeros(matrix.shape[1], dtype=np.float32)
+        for block in row_blocks(len(matrix)):
+            np.maximum(scales, np.abs(matrix[block]).max(axis=0), out=scales)
+        scales /= 127
+        scales[scales == 0] = 1.0
+    else:
+        raise ValueError(f"Unknown embedding precision: {precision}")
+
+    error = np.zeros(matrix.shape[1], dtype=np.float32)
+    for block in row_blocks(len(matrix)):
+        rows = np.asarray(matrix[block], dtype=np.float32)
+        if precision == "int8":
+            codes[block] = np.clip(np.rint(rows / scales), -127, 127)
+        else:
+            codes[block] = rows
+        np.maximum(error, np.abs(codes[block].astype(np.float32) * scales - rows).max(axis=0), out=error)
+    return codes, scales, error
+
+def score_buffer(local, size):
+    """A float32 array of size scores kept on local (a threading.local) and reused by that thread."""
+    buffer = getattr(local, "scores", None)
+    if buffer is None or len(buffer) != size:
+        buffer = np.empty(size, dtype=np.float32)
+        local.scores = buffer
+    return buffer
+
+class CosineScorer:
+    """Exact cosine similarity against movie embeddings that are normalized once up front."""
+
+    def __init__(self, embeddings):
+        self.embeddings = normalize_rows(embeddings)
+        # Score buffers are reused between queries, one per serving thread
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def scores(self, query):
+        # The returned array is this thread's buffer and is overwritten by the next query
+        query = normalize_rows(np.ravel(query))
+        return np.dot(self.embeddings, query, out=score_buffer(self._local, len(self)))
+
+    def top_k(self, query, k, candidates=None):
+        """k best rows, optionally only among candidates (sorted row ids)."""
+        if candidates is None:
+            scores = self.scores(query)
+            indices = top_k_indices(scores, k)
+            return indices, scores[indices].copy()
+        if len(candidates) <= CANDIDATE_GATHER_FRACTION * len(self.embeddings):
+            scores = self.embeddings[candidates] @ normalize_rows(np.ravel(query))
+        else:
+            scores = self.scores(query)[candidates]
+        indices = top_k_indices(scores, k)
+        return candidates[indices], scores[indices]
+
+    def top_k_batch(self, queries, k):
+        """top_k for several queries, scoring blocks of them with one matrix product each."""
+        queries = normalize_rows(np.atleast_2d(queries))
+        block_size = max(1, BATCH_SCORE_ELEMENTS // max(1, len(self.embeddings)))
+        results = []
+        for start in range(0, len(queries), block_size):
+            block_scores = queries[start:start + block_size] @ self.embeddings.T
+            for scores in block_scores:
+                indices = top_k_indices(scores, k)
+                results.append((indices, scores[indices]))
+        return results
+
+class QuantizedScorer:
+    """Cosine top-k that scans a float16 / int8 copy of the embeddings, then re-scores exactly.
+
+    The compact scores are off by at most a bound derived from the quantization error,
+    so every title that could still make the exact top k is kept for re-scoring in
+    float32. Results therefore match CosineScorer, apart from the order of exact ties.
+    """
+
+    def __init__(self, embeddings, precision="int8", normalized=False):
+        # With normalized=True the rows are used as given for re-scoring, so they can be
+        # a read-only np.memmap: only the shortlisted rows are ever paged in
+        self.exact = embeddings if normalized else normalize_rows(embeddings)
+        self.precision = precision
+        self.codes, self.scales, self.error = quantize_rows(self.exact, precision)
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _coarse_scores(self, query, out):
+        weighted = query * self.scales
+        for block in row_blocks(len(self.codes)):
+            np.dot(self.codes[block].astype(np.float32), weighted, out=out[block])
+        return out
+
+    def _rescore(self, query, coarse, k, rows=None):
+        # rows maps positions in coarse to row ids when only some rows were scored
+        k = min(k, len(coarse))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        bound = float(np.abs(query) @ self.error) + SCORE_SLACK
+        kth_score = coarse[top_k_indices(coarse, k)[-1]]
+        # Any title in the exact top k has a compact score of at least kth_score - 2 * bound
+        shortlist = np.flatnonzero(coarse >= kth_score - 2 * bound)
+        if rows is not None:
+            shortlist = rows[shortlist]
+        exact_scores = np.asarray(self.exact[shortlist], dtype=np.float32) @ query
+        indices = top_k_indices(exact_scores, k)
+        return shortlist[indices], exact_scores[indices]
+
+    def top_k(self, query, k, candidates=None):
+        """k best rows, optionally only among candidates (sorted row ids)."""
+        query = normalize_rows(np.ravel(query))
+        if candidates is None:
+            return self._rescore(query, self._coarse_scores(query, score_buffer(self._local, len(self))), k)
+        if len(candidates) <= CANDIDATE_GATHER_FRACTION * len(self.codes):
+            coarse = self.codes[candidates].astype(np.float32) @ (query * self.scales)
+        else:
+            coarse = self._coarse_scores(query, score_buffer(self._local, len(self)))[candidates]
+        return self._rescore(query, coarse, k, candidates)
+
+    def top_k_batch(self, queries, k):
+        queries = normalize_rows(np.atleast_2d(queries))
+        coarse = score_buffer(self._local, len(self))
+        return [self._rescore(query, self._coarse_scores(query, coarse), k) for query in queries]
@@ -0,0 +1,58 @@
+import builtins
+import sys
+import threading
+import time
+
+REPORT_MIN_SECONDS = 0.005 # imports faster than this are left out of the breakdown
+REPORT_MAX_DEPTH = 2 # deeper nested imports are folded into their parent's time
+
+start_time = None
+import_records = [] # [depth, module, seconds] in the order the imports started
+_original_import = builtins.__import__
+_local = threading.local()
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Only first-time absolute imports cost anything worth reporting
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    depth = getattr(_local, "depth", 0)
+    record = [depth, name, None]
+    import_records.append(record)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        record[2] = time.perf_counter() - start
+        _local.depth = depth
+
+def install():
+    """Start timing every module imported from now on (inclusive of its own imports)."""
+    global start_time
+    start_time = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+def uninstall():
+    builtins.__import__ = _original_import
+
+def elapsed():
+    return time.perf_counter() - start_time
+
+def print_imports(title, records):
+    print(f"{title} (cumulative seconds, nested imports indented):")
+    for depth, name, seconds in records:
+        if seconds is not None and seconds >= REPORT_MIN_SECONDS and depth <= REPORT_MAX_DEPTH:
+            print(f"  {seconds:8.3f}  {'  ' * depth}{name}")
+    top_level = sum(seconds for depth, _, seconds in records if depth == 0 and seconds is not None)
+    print(f"  {top_level:8.3f}  total")
+
+def print_report(listen_after, listen_mark, init_timings, ready_after):
+    """listen_mark is len(import_records) when the server could have started listening."""
+    print_imports("Imports before listening", import_records[:listen_mark])
+    print_imports("Imports during initialization", import_records[listen_mark:])
+    print("Initialization phases (including the imports above):")
+    for phase, seconds in init_timings.items():
+        print(f"  {seconds:8.3f}  {phase}")
+    print(f"  {sum(init_timings.values()):8.3f}  total")
+    print(f"Ready to listen after {listen_after:.3f}s")
+    print(f"Ready to serve recommendations after {ready_after:.3f}s")
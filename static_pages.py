@@ -0,0 +1,49 @@
+import gzip
+import hashlib
+from datetime import datetime, timezone
+
+from flask import Response
+
+try:
+    import brotli # optional: without it pages are served gzip-compressed or as they are
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+class StaticPage:
+    """A page rendered once and kept in memory, pre-compressed in every supported encoding.
+
+    Responses carry an ETag and Last-Modified, so a revalidating browser gets an
+    empty 304, and serving the page is a dict lookup instead of a template render.
+    """
+
+    def __init__(self, body, last_modified, mimetype="text/html"):
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        self.mimetype = mimetype
+        self.last_modified = datetime.fromtimestamp(int(last_modified), tz=timezone.utc)
+        self.variants = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        # Every encoding is a separate representation with its own strong ETag
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        self.etags = {encoding: f"{digest}-{encoding}" for encoding in self.variants}
+
+    def encoding_for(self, accept_encodings):
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accept_encodings.quality(encoding) > 0:
+                return encoding
+        return "identity"
+
+    def response(self, request):
+        encoding = self.encoding_for(request.accept_encodings)
+        response = Response(self.variants[encoding], mimetype=self.mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        response.set_etag(self.etags[encoding])
+        response.last_modified = self.last_modified
+        # Browsers may keep the page but check back each time; an unchanged page costs a 304
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
@@ -0,0 +1,251 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from frontend_templates import genres as GENRES
+
+GENERATE_CHUNK_ROWS = 200_000 # rows built in memory and appended at a time (part of the random stream layout)
+MAX_GENRES_PER_TITLE = 3
+GENRE_COUNT_WEIGHTS = [0.35, 0.35, 0.30] # titles with 1, 2 and 3 genres
+NUM_VOTES_MEDIAN = 150 # numVotes is lognormal around this, so a few titles have millions
+NUM_VOTES_SIGMA = 2.0
+NUM_VOTES_RANGE = (5, 3_000_000)
+LATEST_YEAR = 2024
+YEAR_SCALE = 12 # startYear decays exponentially into the past with this many years per e-fold
+RATINGS_PER_USER = 40 # default number of users is ratings / RATINGS_PER_USER
+PEOPLE_PER_TITLE = 0.2 # distinct directors (and writers) per title in the catalog
+
+# Relative share of titles that carry each genre
+GENRE_POPULARITY = {
+    'Action': 8, 'Adult': 1, 'Adventure': 5, 'Animation': 3, 'Biography': 2, 'Comedy': 14, 'Crime': 6,
+    'Documentary': 9, 'Drama': 20, 'Family': 3, 'Fantasy': 3, 'Game-Show': 0.5, 'History': 2, 'Horror': 6,
+    'Music': 2, 'Musical': 1, 'Mystery': 3, 'News': 0.5, 'Reality-TV': 1, 'Romance': 6, 'Sci-Fi': 3,
+    'Sport': 1, 'Talk-Show': 0.5, 'Thriller': 7, 'War': 1, 'Western': 1,
+}
+# Genres that tend to appear together; pairs within a group are GENRE_AFFINITY times likelier
+GENRE_GROUPS = [
+    ['Action', 'Adventure', 'Sci-Fi', 'Fantasy', 'Thriller', 'Crime', 'War', 'Western'],
+    ['Comedy', 'Romance', 'Drama', 'Family', 'Musical', 'Music'],
+    ['Animation', 'Family', 'Adventure', 'Comedy', 'Fantasy'],
+    ['Horror', 'Thriller', 'Mystery', 'Sci-Fi'],
+    ['Crime', 'Drama', 'Mystery', 'Thriller'],
+    ['Documentary', 'Biography', 'History', 'Music', 'News', 'Sport', 'War'],
+    ['Drama', 'Biography', 'History', 'War', 'Romance', 'Sport'],
+    ['Game-Show', 'Reality-TV', 'Talk-Show', 'News'],
+]
+GENRE_AFFINITY = 12.0
+
+TITLE_ADJECTIVES = ['Silent', 'Last', 'Broken', 'Hidden', 'Golden', 'Dark', 'Lost', 'Final', 'Red', 'Wild',
+                    'Secret', 'Endless', 'Crimson', 'Frozen', 'Burning', 'Little', 'American', 'Midnight',
+                    'Electric', 'Forgotten', 'Distant', 'Savage', 'Quiet', 'Bright']
+TITLE_NOUNS = ['River', 'City', 'Kingdom', 'Night', 'Road', 'Heart', 'Storm', 'Garden', 'Shadow', 'Empire',
+               'Island', 'Promise', 'Summer', 'Machine', 'Ghost', 'Mountain', 'Letter', 'Station', 'Dream',
+               'Frontier', 'Witness', 'Harbor', 'Horizon', 'Stranger', 'Season', 'Signal']
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+               'Elizabeth', 'Wei', 'Aiko', 'Carlos', 'Fatima', 'Olga', 'Kwame', 'Priya', 'Lars', 'Sofia',
+               'Mateo', 'Yuki', 'Amara', 'Ivan', 'Chloe', 'Omar', 'Ingrid', 'Ravi', 'Lucia', 'Tomas', 'Hana']
+LAST_NAMES = ['Smith', 'Johnson', 'Garcia', 'Kim', 'Nguyen', 'Muller', 'Rossi', 'Silva', 'Tanaka', 'Okafor',
+              'Kowalski', 'Haddad', 'Novak', 'Larsen', 'Singh', 'Dubois', 'Moreau', 'Chen', 'Lopez', 'Ivanova',
+              'Brown', 'Andersson', 'Costa', 'Sato', 'Mensah', 'Petrov', 'Walsh', 'Reyes', 'Fischer', 'Ali']
+
+def chunk_rng(seed, stream, chunk_index):
+    """Independent generator per (file, chunk); the output depends only on the seed and the sizes."""
+    return np.random.default_rng([seed, stream, chunk_index])
+
+def mix_hash(values, salt):
+    """Deterministic 64-bit hash of integer ids (splitmix64), for per-id attributes without storing them."""
+    x = np.asarray(values, dtype=np.uint64) + np.uint64((0x9E3779B97F4A7C15 * (salt + 1)) % 2**64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def hash_uniform(values, salt):
+    return (mix_hash(values, salt) >> np.uint64(11)).astype(np.float64) / 2**53
+
+def genre_distributions():
+    """Popularity CDF of the first genre, and per-genre CDFs of the genres that join it."""
+    popularity = np.array([GENRE_POPULARITY[g] for g in GENRES], dtype=np.float64)
+    affinity = np.ones((len(GENRES), len(GENRES)))
+    index = {g: i for i, g in enumerate(GENRES)}
+    for group in GENRE_GROUPS:
+        ids = [index[g] for g in group]
+        affinity[np.ix_(ids, ids)] = GENRE_AFFINITY
+    co_occurrence = affinity * popularity
+    np.fill_diagonal(co_occurrence, 0)
+    next_cdfs = np.cumsum(co_occurrence / co_occurrence.sum(axis=1, keepdims=True), axis=1)
+    return np.cumsum(popularity / popularity.sum()), next_cdfs
+
+def sample_cdf(cdf, uniforms):
+    return np.minimum(np.searchsorted(cdf, uniforms, side="right"), len(cdf) - 1)
+
+def title_names(title_ids, seed):
+    """primaryTitle for each title id, derived from the id so it never has to be stored.
+
+    Names repeat across ids (remakes, common titles) like they do in the real catalog.
+    """
+    h = mix_hash(title_ids, seed * 7 + 1)
+    adjectives = (h % np.uint64(len(TITLE_ADJECTIVES))).astype(np.int64)
+    nouns = ((h >> np.uint64(8)) % np.uint64(len(TITLE_NOUNS))).astype(np.int64)
+    other_nouns = ((h >> np.uint64(16)) % np.uint64(len(TITLE_NOUNS))).astype(np.int64)
+    patterns = ((h >> np.uint64(24)) % np.uint64(4)).astype(np.int64)
+    sequels = ((h >> np.uint64(32)) % np.uint64(1000)).astype(np.int64)
+    names = []
+    for adjective, noun, other, pattern, sequel in zip(adjectives, nouns, other_nouns, patterns, sequels):
+        if pattern == 0:
+            name = f"The {TITLE_ADJECTIVES[adjective]} {TITLE_NOUNS[noun]}"
+        elif pattern == 1:
+            name = f"{TITLE_NOUNS[noun]} of the {TITLE_NOUNS[other]}"
+        elif pattern == 2:
+            name = f"{TITLE_ADJECTIVES[adjective]} {TITLE_NOUNS[noun]}"
+        else:
+            name = f"{TITLE_ADJECTIVES[adjective]} {TITLE_NOUNS[noun]} {TITLE_NOUNS[other]}"
+        # Roughly 1 in 12 titles is a sequel
+        if sequel < 85:
+            name = f"{name} {2 + sequel % 4}"
+        names.append(name)
+    return names
+
+def person_names(person_ids, salt):
+    h = mix_hash(person_ids, salt)
+    first = (h % np.uint64(len(FIRST_NAMES))).astype(np.int64)
+    last = ((h >> np.uint64(16)) % np.uint64(len(LAST_NAMES))).astype(np.int64)
+    # The id keeps people with the same first and last name apart
+    return [f"{FIRST_NAMES[f]} {LAST_NAMES[l]} {i}" for f, l, i in zip(first, last, np.asarray(person_ids))]
+
+def zipf_ids(rng, num_ids, size, exponent=2.0):
+    """Ids in [0, num_ids) where low ids are much more frequent (a few prolific people or users)."""
+    return np.minimum((num_ids * rng.random(size) ** exponent).astype(np.int64), num_ids - 1)
+
+def genre_strings(codes):
+    """"['Drama', 'Romance']"-style strings for rows of genre ids, where -1 marks no genre."""
+    keys, inverse = np.unique(codes, axis=0, return_inverse=True)
+    formatted = [str([GENRES[g] for g in key if g >= 0]) for key in keys]
+    return [formatted[i] for i in np.ravel(inverse)]
+
+def sample_genres(rng, size, first_cdf, next_cdfs):
+    """Rows of up to MAX_GENRES_PER_TITLE genre ids in alphabetical order, padded with -1."""
+    codes = np.full((size, MAX_GENRES_PER_TITLE), -1, dtype=np.int64)
+    counts = sample_cdf(np.cumsum(GENRE_COUNT_WEIGHTS), rng.random(size)) + 1
+    codes[:, 0] = sample_cdf(first_cdf, rng.random(size))
+    for slot in range(1, MAX_GENRES_PER_TITLE):
+        # Each further genre is drawn from the ones that go with the first genre
+        uniforms = rng.random(size)
+        candidates = np.empty(size, dtype=np.int64)
+        for genre in range(len(GENRES)):
+            rows = codes[:, 0] == genre
+            candidates[rows] = sample_cdf(next_cdfs[genre], uniforms[rows])
+        fresh = (counts > slot) & ~(codes[:, :slot] == candidates[:, None]).any(axis=1)
+        codes[fresh, slot] = candidates[fresh]
+    # IMDb lists a title's genres alphabetically, and GENRES is alphabetical
+    ordered = np.sort(np.where(codes < 0, len(GENRES), codes), axis=1)
+    return np.where(ordered == len(GENRES), -1, ordered)
+
+def write_catalog(path, num_titles, seed=0):
+    """Stream a cleaned_data.csv with num_titles titles to path.
+
+    Returns (num_votes, average_rating) per title, which write_user_data needs to
+    decide which titles get rated and how.
+    """
+    import pandas as pd
+
+    first_cdf, next_cdfs = genre_distributions()
+    num_people = max(1, int(num_titles * PEOPLE_PER_TITLE))
+    num_votes = np.empty(num_titles, dtype=np.int32)
+    average_rating = np.empty(num_titles, dtype=np.float32)
+    with open(path, "w", newline="") as f:
+        for chunk_index, start in enumerate(range(0, num_titles, GENERATE_CHUNK_ROWS)):
+            rng = chunk_rng(seed, 0, chunk_index)
+            ids = np.arange(start, min(start + GENERATE_CHUNK_ROWS, num_titles))
+            size = len(ids)
+
+            codes = sample_genres(rng, size, first_cdf, next_cdfs)
+            # The first titles cover every genre once, so even tiny catalogs have all genre columns...
+            covering = ids < len(GENRES)
+            codes[covering] = -1
+            codes[covering, 0] = ids[covering]
+
+            votes = np.exp(rng.normal(np.log(NUM_VOTES_MEDIAN), NUM_VOTES_SIGMA, size))
+            votes = np.clip(votes, *NUM_VOTES_RANGE).astype(np.int32)
+            # Widely seen titles rate a little higher and vary less
+            rating = rng.normal(5.6 + 0.15 * np.log10(votes), 1.4 - 0.1 * np.log10(votes))
+            rating = np.round(np.clip(rating, 1.0, 10.0), 1).astype(np.float32)
+            years = np.maximum(LATEST_YEAR - np.floor(rng.exponential(YEAR_SCALE, size)), 1920).astype(np.int32)
+            # ...and are recent, so preprocess_data's startYear filter keeps them
+            years[covering] = LATEST_YEAR
+            num_votes[ids], average_rating[ids] = votes, rating
+
+            pd.DataFrame({
+                'tconst': [f"tt{i:08d}" for i in ids],
+                'primaryTitle': title_names(ids, seed),
+                'startYear': years,
+                'averageRating': rating,
+                'numVotes': votes,
+                # Only movies: prepare_features treats other titleType columns as model inputs
+                'titleType': 'movie',
+                'genres': genre_strings(codes),
+                'directorNames': person_names(zipf_ids(rng, num_people, size), seed * 7 + 2),
+                'writerNames': person_names(zipf_ids(rng, num_people, size), seed * 7 + 3),
+                'isAdult': (codes == GENRES.index('Adult')).any(axis=1).astype(np.int8),
+            }).to_csv(f, header=chunk_index == 0, index=False)
+    return num_votes, average_rating
+
+def write_user_data(path, num_ratings, num_votes, average_rating, num_users=None, seed=0):
+    """Stream a user_data.csv with num_ratings ratings of the catalog's titles to path.
+
+    Popular titles (high numVotes) are rated more often, a few heavy users rate far
+    more than the rest, and each user's favourites are fixed per user id.
+    """
+    import pandas as pd
+
+    num_users = max(1, num_ratings // RATINGS_PER_USER) if num_users is None else num_users
+    title_cdf = np.cumsum(num_votes, dtype=np.float64)
+    title_cdf /= title_cdf[-1]
+    first_cdf, _ = genre_distributions()
+    with open(path, "w", newline="") as f:
+        for chunk_index, start in enumerate(range(0, num_ratings, GENERATE_CHUNK_ROWS)):
+            rng = chunk_rng(seed, 1, chunk_index)
+            size = min(GENERATE_CHUNK_ROWS, num_ratings - start)
+            users = zipf_ids(rng, num_users, size, exponent=1.5)
+            titles = sample_cdf(title_cdf, rng.random(size))
+            ratings = np.clip(np.round(average_rating[titles] + rng.normal(0, 1.5, size)), 1, 10).astype(np.int8)
+
+            favorite = sample_cdf(first_cdf, hash_uniform(users, seed * 7 + 4))
+            second = sample_cdf(first_cdf, hash_uniform(users, seed * 7 + 5))
+            second = np.where(second == favorite, (second + 1) % len(GENRES), second)
+            pd.DataFrame({
+                'UserID': [f"ur{u:08d}" for u in users],
+                'tconst': [f"tt{t:08d}" for t in titles],
+                'UserRating': ratings,
+                'FavoriteGenres': genre_strings(np.stack([favorite, second], axis=1)),
+                'FavoriteDirectors': person_names(mix_hash(users, seed * 7 + 6) % np.uint64(1000), seed * 7 + 2),
+                'FavoriteActors': person_names(mix_hash(users, seed * 7 + 7) % np.uint64(1000), seed * 7 + 8),
+                'primaryTitle': title_names(titles, seed),
+            }).to_csv(f, header=chunk_index == 0, index=False)
+
+def generate(out_dir, num_titles, num_ratings, num_users=None, seed=0):
+    """Write cleaned_data.csv and user_data.csv into out_dir; returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    movie_path = os.path.join(out_dir, "cleaned_data.csv")
+    user_path = os.path.join(out_dir, "user_data.csv")
+    num_votes, average_rating = write_catalog(movie_path, num_titles, seed)
+    write_user_data(user_path, num_ratings, num_votes, average_rating, num_users, seed)
+    return movie_path, user_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic data/cleaned_data.csv and data/user_data.csv")
+    parser.add_argument("--titles", type=int, default=100_000)
+    parser.add_argument("--ratings", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, help=f"default: ratings / {RATINGS_PER_USER}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out-dir", default="data")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = generate(args.out_dir, args.titles, args.ratings, args.users, args.seed)
+    sizes = ", ".join(f"{path} ({os.path.getsize(path) / 2**20:.1f} MiB)" for path in paths)
+    print(f"Wrote {sizes} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
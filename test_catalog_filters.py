@@ -0,0 +1,159 @@
+import numpy as np
+import pytest
+
+import vae_main
+from catalog_filters import CatalogFilters, GenreIndex, SortedColumnIndex, bitset_rows
+
+NUM_TITLES = 3001 # not a multiple of 8, so the packed bitsets end in padding bits
+GENRES = [f"Genre{i:02d}" for i in range(26)]
+TITLE_TYPES = ["movie", "short", "tvSeries"]
+
+def synthetic_catalog(seed=0):
+    rng = np.random.default_rng(seed)
+    rating = np.round(rng.uniform(1, 10, NUM_TITLES), 1)
+    votes = np.round(rng.lognormal(5, 2, NUM_TITLES))
+    year = rng.integers(2001, 2025, NUM_TITLES).astype(np.float64)
+    for column in (rating, votes, year):
+        column[rng.random(NUM_TITLES) < 0.05] = np.nan
+    type_codes = rng.integers(-1, len(TITLE_TYPES), NUM_TITLES)
+    genre_flags = rng.random((NUM_TITLES, len(GENRES))) < 0.12
+    return {"rating": rating, "votes": votes, "year": year, "type_codes": type_codes, "genre_flags": genre_flags}
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = synthetic_catalog()
+    monkeypatch.setattr(vae_main, "catalog_filters", CatalogFilters(
+        {"averageRating": catalog["rating"], "numVotes": catalog["votes"], "startYear": catalog["year"]},
+        {"titleType": (catalog["type_codes"], TITLE_TYPES)},
+    ))
+    monkeypatch.setattr(vae_main, "genre_index", GenreIndex(catalog["genre_flags"], GENRES))
+    return catalog
+
+def brute_force(catalog, filters, genres_selected):
+    """The rows filter_candidates should return, checked one condition at a time on full columns."""
+    keep = np.ones(NUM_TITLES, dtype=bool)
+    # NaN never passes a comparison, so a bound on a column drops its missing values
+    if filters.get("min_rating") is not None:
+        keep &= catalog["rating"] >= filters["min_rating"]
+    if filters.get("min_votes") is not None:
+        keep &= catalog["votes"] >= filters["min_votes"]
+    if filters.get("year_from") is not None:
+        keep &= catalog["year"] >= filters["year_from"]
+    if filters.get("year_to") is not None:
+        keep &= catalog["year"] <= filters["year_to"]
+    if filters.get("title_types"):
+        wanted = [TITLE_TYPES.index(t) for t in filters["title_types"] if t in TITLE_TYPES]
+        keep &= np.isin(catalog["type_codes"], wanted)
+    flags = catalog["genre_flags"]
+    def columns(genres):
+        return [GENRES.index(genre) for genre in genres if genre in GENRES]
+    if filters.get("genres_any"):
+        keep &= flags[:, columns(filters["genres_any"])].any(axis=1)
+    if filters.get("genres_all"):
+        if not set(filters["genres_all"]).issubset(GENRES):
+            keep[:] = False
+        keep &= flags[:, columns(filters["genres_all"])].all(axis=1)
+    if filters.get("genres_exclude"):
+        keep &= ~flags[:, columns(filters["genres_exclude"])].any(axis=1)
+    if filters.get("min_genre_overlap"):
+        keep &= flags[:, columns(set(genres_selected))].sum(axis=1) >= filters["min_genre_overlap"]
+    return np.flatnonzero(keep)
+
+def random_filters(rng):
+    filters = {}
+    if rng.random() < 0.4:
+        filters["min_rating"] = float(np.round(rng.uniform(1, 10), 1))
+    if rng.random() < 0.3:
+        filters["min_votes"] = int(rng.integers(0, 2000))
+    if rng.random() < 0.3:
+        filters["year_from"] = int(rng.integers(2000, 2025))
+    if rng.random() < 0.3:
+        filters["year_to"] = int(rng.integers(2000, 2025))
+    if rng.random() < 0.3:
+        filters["title_types"] = list(rng.choice(TITLE_TYPES + ["unknownType"], rng.integers(1, 3), replace=False))
+    for name in ("genres_any", "genres_all", "genres_exclude"):
+        if rng.random() < 0.35:
+            filters[name] = list(rng.choice(GENRES, rng.integers(1, 4), replace=False))
+    if rng.random() < 0.3:
+        filters["min_genre_overlap"] = int(rng.integers(1, 4))
+    return filters
+
+EDGE_CASES = [
+    ({"min_rating": 7.0}, ()), # a bound equal to stored values keeps them
+    ({"year_from": 2010, "year_to": 2010}, ()),
+    ({"year_from": 2020, "year_to": 2010}, ()),
+    ({"title_types": ["unknownType"]}, ()),
+    ({"genres_all": ["Genre01", "NotAGenre"]}, ()),
+    ({"genres_any": ["NotAGenre"]}, ()),
+    ({"genres_exclude": ["Genre03"]}, ()), # ~union must not turn the padding bits into rows
+    ({"genres_exclude": ["NotAGenre"]}, ()),
+    ({"genres_all": ["Genre01", "Genre02", "Genre03"]}, ()), # sparse result
+    ({"genres_exclude": ["Genre04"], "min_rating": 2.0}, ()), # dense result
+    ({"min_genre_overlap": 2}, ("Genre00", "Genre05", "Genre07")),
+    ({"min_genre_overlap": 2, "min_votes": 50}, ("Genre00", "Genre05", "Genre07")),
+    ({"min_genre_overlap": 1}, ()),
+]
+
+@pytest.mark.parametrize("filters, genres_selected", EDGE_CASES)
+def test_edge_cases_match_brute_force(catalog, filters, genres_selected):
+    rows = vae_main.filter_candidates(filters, genres_selected)
+    np.testing.assert_array_equal(rows, brute_force(catalog, filters, genres_selected))
+
+def test_random_filters_match_brute_force(catalog):
+    rng = np.random.default_rng(1)
+    for _ in range(300):
+        filters = random_filters(rng)
+        genres_selected = tuple(rng.choice(GENRES, rng.integers(0, 4), replace=False))
+        rows = vae_main.filter_candidates(filters, genres_selected)
+        if not filters:
+            assert rows is None
+        else:
+            np.testing.assert_array_equal(rows, brute_force(catalog, filters, genres_selected), err_msg=str(filters))
+
+def test_no_filters_means_no_candidate_list(catalog):
+    assert vae_main.filter_candidates(None) is None
+    assert vae_main.filter_candidates({}) is None
+
+def test_sorted_column_index_excludes_nan_and_keeps_bounds():
+    index = SortedColumnIndex([3.0, np.nan, 1.0, 2.0, 3.0, np.nan])
+    assert len(index) == 4
+    assert sorted(index.rows_between(1.0, 3.0)) == [0, 2, 3, 4]
+    assert sorted(index.rows_between(3.0, None)) == [0, 4]
+    assert sorted(index.rows_between(None, 1.0)) == [2]
+    assert len(index.rows_between(3.5, 1.0)) == 0
+
+@pytest.mark.parametrize("density", [0.001, 0.05, 0.5])
+def test_bitset_rows_matches_unpacked_bits(density):
+    # The sparse and dense expansion paths must agree with a plain unpack
+    rng = np.random.default_rng(2)
+    bits = rng.random(NUM_TITLES) < density
+    np.testing.assert_array_equal(bitset_rows(np.packbits(bits), NUM_TITLES), np.flatnonzero(bits))
+
+@pytest.mark.parametrize("num_genres", [40, 70]) # uint64 masks, and no masks at all
+def test_wide_genre_lists_match_brute_force(num_genres):
+    rng = np.random.default_rng(3)
+    genres = [f"Genre{i:02d}" for i in range(num_genres)]
+    flags = rng.random((NUM_TITLES, num_genres)) < 0.1
+    index = GenreIndex(flags, genres)
+    all_rows = np.arange(NUM_TITLES)
+    some_rows = np.sort(rng.choice(NUM_TITLES, 200, replace=False))
+    for _ in range(100):
+        # The highest genres set the top bits of the masks
+        any_of, all_of, exclude, overlap = (list(rng.choice(genres[-12:], rng.integers(0, 3), replace=False))
+                                            for _ in range(4))
+        min_overlap = int(rng.integers(0, 3))
+        def has(genre_list):
+            return flags[:, [genres.index(genre) for genre in genre_list]]
+        keep = np.ones(NUM_TITLES, dtype=bool)
+        if any_of:
+            keep &= has(any_of).any(axis=1)
+        if all_of:
+            keep &= has(all_of).all(axis=1)
+        if exclude:
+            keep &= ~has(exclude).any(axis=1)
+        if min_overlap:
+            keep &= has(overlap).sum(axis=1) >= min_overlap
+        kwargs = dict(any_of=any_of, all_of=all_of, exclude=exclude, overlap=overlap, min_overlap=min_overlap)
+        if any_of or all_of or exclude or min_overlap:
+            np.testing.assert_array_equal(index.candidates(**kwargs), all_rows[keep])
+        np.testing.assert_array_equal(index.candidates(rows=some_rows, **kwargs), some_rows[keep[some_rows]])
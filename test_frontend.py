@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import frontend
+
+GOOD_QUERY = {"genres": ["Drama"], "avg_rating": 7.5, "num_votes": 100, "top_n": 3}
+
+@pytest.fixture
+def client(monkeypatch):
+    batches = []
+    def fake_recommend_batch(queries):
+        batches.append(queries)
+        return [[{"title": f"{genres_selected[0]} {i}"} for i in range(top_n)]
+                for genres_selected, _, _, top_n, _ in queries]
+    monkeypatch.setattr(frontend, "recommend_batch", fake_recommend_batch)
+    client = frontend.app.test_client()
+    client.batches = batches
+    return client
+
+def post_raw(client, body):
+    # Written by hand: json.dumps cannot produce an integer too large for a float
+    return client.post("/api/recommend", data=body, content_type="application/json")
+
+@pytest.mark.parametrize("field, raw_value", [
+    ("avg_rating", "1" + "0" * 400), # float() raises OverflowError
+    ("num_votes", "1e400"), # parses as inf, and int(inf) raises OverflowError
+    ("avg_rating", "NaN"),
+    ("avg_rating", "Infinity"),
+    ("num_votes", "NaN"),
+    ("avg_rating", "true"),
+    ("num_votes", "false"),
+])
+def test_bad_number_fails_only_its_item(client, field, raw_value):
+    good = json.dumps(GOOD_QUERY)
+    bad = json.dumps({**GOOD_QUERY, field: "PLACEHOLDER"}).replace('"PLACEHOLDER"', raw_value)
+    response = post_raw(client, f"[{good}, {bad}, {good}]")
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert "error" in results[1] and "recommendations" not in results[1]
+    for result in (results[0], results[2]):
+        assert len(result["recommendations"]) == GOOD_QUERY["top_n"]
+    assert len(client.batches) == 1 and len(client.batches[0]) == 2 # the bad item never reached the model
+
+def test_valid_numbers_are_parsed(client):
+    response = client.post("/api/recommend", json={**GOOD_QUERY, "avg_rating": 10, "num_votes": "250"})
+    assert response.status_code == 200 and "recommendations" in response.get_json()
+    _, avg_rating, num_votes, _, _ = client.batches[0][0]
+    assert (avg_rating, num_votes) == (10.0, 250)
+
+@pytest.mark.parametrize("name, raw_value", [
+    ("min_votes", "1" + "0" * 400),
+    ("year_from", "1e400"),
+    ("min_rating", "NaN"),
+    ("min_rating", "-Infinity"),
+    ("min_votes", "NaN"),
+    ("min_genre_overlap", "true"),
+])
+def test_bad_filter_fails_only_its_item(client, name, raw_value):
+    good = json.dumps(GOOD_QUERY)
+    bad = json.dumps({**GOOD_QUERY, "filters": {name: "PLACEHOLDER"}}).replace('"PLACEHOLDER"', raw_value)
+    results = post_raw(client, f"[{bad}, {good}]").get_json()["results"]
+    assert results[0] == {"error": f"Invalid {name} filter."}
+    assert len(results[1]["recommendations"]) == GOOD_QUERY["top_n"]
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from micro_batcher import MicroBatcher
+
+def submit_concurrently(batcher, items):
+    """{item: result or raised exception} with every item submitted from its own thread."""
+    results, start = {}, threading.Barrier(len(items))
+    def submit(item):
+        start.wait()
+        try:
+            results[item] = batcher.submit(item)
+        except Exception as e:
+            results[item] = e
+    threads = [threading.Thread(target=submit, args=(item,), daemon=True) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads), "a submitter never got its result"
+    return results
+
+def test_each_submitter_gets_its_own_result():
+    batch_sizes = []
+    def double(items):
+        batch_sizes.append(len(items))
+        time.sleep(0.005) # let the others queue up behind the first batch
+        return [item * 2 for item in items]
+    batcher = MicroBatcher(double, max_batch_size=16, max_wait=0.05)
+    results = submit_concurrently(batcher, list(range(50)))
+    assert results == {item: item * 2 for item in range(50)}
+    assert sum(batch_sizes) == 50 and max(batch_sizes) <= 16
+    assert len(batch_sizes) < 50 # concurrent submitters were batched together
+
+def test_lone_submitter_does_not_wait_for_the_window():
+    batcher = MicroBatcher(lambda items: items, max_wait=1.0)
+    batcher.submit(0) # starts the worker thread
+    start = time.perf_counter()
+    assert batcher.submit(1) == 1
+    assert time.perf_counter() - start < 0.5
+
+def test_exception_result_fails_only_its_item():
+    def process(items):
+        return [ValueError(f"bad {item}") if item % 5 == 0 else item for item in items]
+    results = submit_concurrently(MicroBatcher(process, max_wait=0.05), list(range(20)))
+    for item, result in results.items():
+        if item % 5 == 0:
+            assert isinstance(result, ValueError) and str(result) == f"bad {item}"
+        else:
+            assert result == item
+
+def test_raising_batch_fails_every_item_in_it():
+    def process(items):
+        raise RuntimeError("batch failed")
+    results = submit_concurrently(MicroBatcher(process, max_wait=0.05), list(range(5)))
+    assert all(isinstance(result, RuntimeError) for result in results.values())
+
+@pytest.mark.parametrize("extra", [-1, -3])
+def test_short_result_list_does_not_block_submitters(extra):
+    batcher = MicroBatcher(lambda items: [item for item in items][:max(0, len(items) + extra)], max_wait=0.05)
+    results = submit_concurrently(batcher, list(range(8)))
+    failed = [item for item, result in results.items() if isinstance(result, RuntimeError)]
+    assert failed # the items without a result were failed instead of left waiting
+    assert all(results[item] == item for item in results if item not in failed)
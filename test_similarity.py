@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex
+from similarity import CANDIDATE_GATHER_FRACTION, CosineScorer, QuantizedScorer, normalize_rows, top_k_indices
+
+NUM_TITLES = 5000
+DIM = 10
+
+@pytest.fixture(scope="module")
+def embeddings():
+    # Clustered like real embeddings, so many titles score close to each other
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, DIM))
+    return (centers[rng.integers(0, 20, NUM_TITLES)] + 0.3 * rng.normal(size=(NUM_TITLES, DIM))).astype(np.float32)
+
+@pytest.fixture(scope="module")
+def queries():
+    return np.random.default_rng(1).normal(size=(25, DIM)).astype(np.float32)
+
+def exact_top_k(embeddings, query, k, candidates=None):
+    # Reference: float64 scores over every allowed row, fully sorted
+    rows = np.arange(len(embeddings)) if candidates is None else candidates
+    scores = normalize_rows(embeddings)[rows].astype(np.float64) @ (query / np.linalg.norm(query))
+    order = np.argsort(-scores, kind="stable")[:k]
+    return rows[order], scores[order]
+
+def assert_same_top_k(result, expected):
+    indices, scores = result
+    expected_indices, expected_scores = expected
+    assert len(indices) == len(expected_indices)
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+    # A different title is only acceptable where it ties the k-th best score to float32 precision
+    swapped = np.isin(indices, expected_indices, invert=True)
+    np.testing.assert_allclose(scores[swapped], expected_scores[-1], atol=1e-5)
+
+def test_top_k_indices_is_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3], dtype=np.float32)
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 4, 0]
+    assert len(top_k_indices(scores, 0)) == 0
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+@pytest.mark.parametrize("k", [1, 10, 100])
+def test_quantized_matches_cosine(embeddings, queries, precision, k):
+    exact = CosineScorer(embeddings)
+    quantized = QuantizedScorer(embeddings, precision)
+    for query in queries:
+        expected = exact_top_k(embeddings, query, k)
+        assert_same_top_k(exact.top_k(query, k), expected)
+        assert_same_top_k(quantized.top_k(query, k), expected)
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_quantized_on_prenormalized_rows(embeddings, queries, precision):
+    quantized = QuantizedScorer(normalize_rows(embeddings), precision, normalized=True)
+    for query in queries:
+        assert_same_top_k(quantized.top_k(query, 20), exact_top_k(embeddings, query, 20))
+
+# Below and above CANDIDATE_GATHER_FRACTION, so both the gather and the full-scan paths run
+@pytest.mark.parametrize("fraction", [0.01, CANDIDATE_GATHER_FRACTION / 2, 0.6])
+def test_candidates_restrict_top_k(embeddings, queries, fraction):
+    rng = np.random.default_rng(2)
+    candidates = np.sort(rng.choice(NUM_TITLES, int(NUM_TITLES * fraction), replace=False))
+    scorers = [CosineScorer(embeddings), QuantizedScorer(embeddings, "float16"), QuantizedScorer(embeddings, "int8"),
+               IVFIndex.build(embeddings, nprobe=10 ** 6)]
+    for query in queries[:10]:
+        expected = exact_top_k(embeddings, query, 15, candidates)
+        for scorer in scorers:
+            result = scorer.top_k(query, 15, candidates=candidates)
+            assert set(result[0].tolist()) <= set(candidates.tolist())
+            assert_same_top_k(result, expected)
+
+def test_candidates_fewer_than_k(embeddings, queries):
+    candidates = np.array([3, 70, 1200])
+    for scorer in (CosineScorer(embeddings), QuantizedScorer(embeddings, "int8")):
+        indices, _ = scorer.top_k(queries[0], 10, candidates=candidates)
+        assert sorted(indices.tolist()) == candidates.tolist()
+
+@pytest.mark.parametrize("scorer_class, args", [(CosineScorer, ()), (QuantizedScorer, ("int8",))])
+def test_batch_matches_single_queries(embeddings, queries, scorer_class, args):
+    scorer = scorer_class(embeddings, *args)
+    for query, result in zip(queries, scorer.top_k_batch(queries, 12)):
+        assert_same_top_k(result, scorer.top_k(query, 12))
+
+def test_ivf_probing_every_list_is_exact(embeddings, queries):
+    index = IVFIndex.build(embeddings)
+    for query in queries:
+        assert_same_top_k(index.top_k(query, 10, nprobe=len(index.centroids)), exact_top_k(embeddings, query, 10))
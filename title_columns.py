@@ -0,0 +1,42 @@
+import numpy as np
+
+OVERFETCH_FACTOR = 2 # when titles repeat, the first fetch for n distinct titles is this many times n rows
+
+class TitleColumns:
+    """Per-row result fields of the catalog as plain parallel arrays, built once at load time.
+
+    title_ids gives rows that share a title the same id, so duplicate titles are
+    resolved from a small int array per request instead of a pandas drop_duplicates.
+    A response is built from just the winning row ids, with no DataFrame involved.
+    """
+
+    def __init__(self, tconsts, titles, genres, genre_lists, title_ids):
+        self.tconsts = np.asarray(tconsts, dtype=object)
+        self.titles = np.asarray(titles, dtype=object)
+        self.genres = np.asarray(genres, dtype=object)
+        self.genre_lists = np.empty(len(genre_lists), dtype=object)
+        self.genre_lists[:] = [tuple(genre_list) for genre_list in genre_lists]
+        self.title_ids = np.asarray(title_ids, dtype=np.int64)
+        # Most rows any one title has; fetching n times this many rows always yields n distinct titles
+        self.max_duplicates = int(np.bincount(self.title_ids).max()) if len(self.title_ids) else 1
+
+    def __len__(self):
+        return len(self.title_ids)
+
+    def fetch_size(self, n):
+        """Rows to fetch first for n distinct titles; exactly n when no title repeats."""
+        return n * min(self.max_duplicates, OVERFETCH_FACTOR)
+
+    def fetch_limit(self, n):
+        return n * self.max_duplicates
+
+    def distinct(self, top_indices, n):
+        """Positions in top_indices (best first) of the first n rows with a title not seen before."""
+        positions, seen = [], set()
+        for position, title_id in enumerate(self.title_ids[top_indices].tolist()):
+            if title_id not in seen:
+                seen.add(title_id)
+                positions.append(position)
+                if len(positions) == n:
+                    break
+        return positions
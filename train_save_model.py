@@ -1,25 +1,211 @@
+import argparse
+import glob
+import hashlib
+import os
+import re
+import shutil
+import time
+
+import numpy as np
 import torch
-from vae_main import preprocess_data, prepare_features, create_x_input, train_vae
+from vae_main import FEATURE_VERSION, HIDDEN_DIMS, LATENT_DIM, preprocess_data, prepare_features, create_x_input
+from vae_network import DEVICE, VAE, make_optimizer, train_vae
+from embedding_index import HASH_CHUNK_SIZE, atomic_write
+from training_snapshot import load_snapshot, save_snapshot, training_snapshot_path
 
 EPOCHS = 10
+BATCH_SIZE = 64
+LEARNING_RATE = 1e-3
+TRAIN_THREADS = None # torch intra-op threads for training; None keeps torch's default
+FINETUNE_EPOCHS = 2 # epochs over the new rows (plus replay) in incremental mode
+FINETUNE_LEARNING_RATE = 1e-4
+REPLAY_RATIO = 1.0 # older rows replayed per new row when fine-tuning; 0 trains on new rows only
+MODEL_VERSION_PATTERN = re.compile(r"\.v(\d+)\.pth$")
+
+def load_training_data(movie_data_path, user_data_path, use_snapshot=True):
+    """Training matrix for the VAE as a dict with x_input, genre_list and row provenance.
+
+    user_row is the user_data.csv row behind each training row and num_user_rows the
+    number of rows the file had. The cached snapshot is reused while the CSVs are unchanged.
+    """
+    snapshot_path = training_snapshot_path(user_data_path)
+    paths = [movie_data_path, user_data_path]
+    start = time.perf_counter()
+    if use_snapshot:
+        snapshot = load_snapshot(snapshot_path, paths)
+        if snapshot is not None:
+            print(f"Loaded training snapshot {snapshot_path} ({len(snapshot['x_input'])} rows) "
+                  f"in {time.perf_counter() - start:.2f}s")
+            return snapshot
+
+    fitted_state = {}
+    data, user_data, _, _ = preprocess_data(movie_data_path, user_data_path, fitted_state=fitted_state)
+    genre_list, merged_data, _, movie_genres = prepare_features(data, user_data)
+    x_input = create_x_input(merged_data, movie_genres)
+    user_row = merged_data['user_row'].to_numpy()
+    if use_snapshot:
+        save_snapshot(snapshot_path, paths, x_input, merged_data['UserID'].to_numpy(),
+                      merged_data['tconst'].to_numpy(), user_row, len(user_data), fitted_state, genre_list)
+        print(f"Saved training snapshot {snapshot_path} ({len(x_input)} rows) "
+              f"in {time.perf_counter() - start:.2f}s")
+    return {'x_input': x_input, 'genre_list': genre_list, 'user_row': user_row, 'num_user_rows': len(user_data)}
+
+def training_state_path(model_path):
+    """Optimizer state and training progress saved alongside a model file."""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}.train.pt"
+
+def versioned_model_path(model_path, version):
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.v{version}{ext}"
+
+def next_model_version(model_path):
+    root, ext = os.path.splitext(model_path)
+    existing = glob.glob(f"{glob.escape(root)}.v*{ext}")
+    versions = [int(match.group(1)) for match in map(MODEL_VERSION_PATTERN.search, existing) if match]
+    return max(versions, default=0) + 1
+
+def file_prefix_digest(path, num_bytes):
+    """SHA-256 of the first num_bytes of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = num_bytes
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def user_data_mark(user_data_path):
+    # Taken before the data is read: rows appended while training count as new next time
+    num_bytes = os.path.getsize(user_data_path)
+    return {"user_data_bytes": num_bytes, "user_data_digest": file_prefix_digest(user_data_path, num_bytes)}
+
+def load_training_state(model_path):
+    path = training_state_path(model_path)
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, map_location=DEVICE)
+
+def save_trained_model(vae, optimizer, save_path, mark, num_user_rows, parent_version=None):
+    """Write the weights as the next versioned model file, then make that version the live save_path.
+
+    The training state saved with each version holds the optimizer state and how much of
+    user_data.csv the model has seen, which is where the next incremental run starts.
+    """
+    version = next_model_version(save_path)
+    versioned_path = versioned_model_path(save_path, version)
+    torch.save(vae.state_dict(), versioned_path)
+    state = {"version": version, "parent_version": parent_version, "feature_version": FEATURE_VERSION,
+             "optimizer": optimizer.state_dict(), "num_user_rows": num_user_rows, **mark}
+    torch.save(state, training_state_path(versioned_path))
+
+    # Replace the live files atomically so a serving process never reads a partial model
+    for source, target in [(versioned_path, save_path),
+                           (training_state_path(versioned_path), training_state_path(save_path))]:
+        with open(source, "rb") as f:
+            atomic_write(target, lambda out: shutil.copyfileobj(f, out))
+    print(f"Model saved to {versioned_path} and {save_path}")
+    return versioned_path
 
 # Define the training process
-def train_and_save_model(movie_data_path, user_data_path, save_path="vae_model.pth"):
-    data, user_data, _, _ = preprocess_data(movie_data_path, user_data_path)
-    _, merged_data, _ = prepare_features(data, user_data)
-    x_input = create_x_input(merged_data)
+def train_and_save_model(movie_data_path, user_data_path, save_path="vae_model.pth", epochs=EPOCHS,
+                         batch_size=BATCH_SIZE, num_threads=TRAIN_THREADS):
+    mark = user_data_mark(user_data_path)
+    training = load_training_data(movie_data_path, user_data_path)
+    x_input = training['x_input']
 
     # Train VAE
-    vae = train_vae(x_input, epochs=EPOCHS, batch_size=64, learning_rate=1e-3)
+    vae = VAE(x_input.shape[1], *HIDDEN_DIMS, LATENT_DIM)
+    optimizer = make_optimizer(vae.parameters(), LEARNING_RATE)
+    train_vae(x_input, epochs=epochs, batch_size=batch_size, learning_rate=LEARNING_RATE,
+              num_genres=len(training['genre_list']), num_threads=num_threads, vae=vae, optimizer=optimizer)
 
     # Save the model
-    torch.save(vae.state_dict(), save_path)
-    print(f"Model saved to {save_path}")
+    return save_trained_model(vae, optimizer, save_path, mark, training['num_user_rows'])
+
+def new_row_mask(training, state, user_data_path):
+    """Training rows built from user_data.csv rows that the saved model has not been trained on."""
+    all_rows = np.ones(len(training['x_input']), dtype=bool)
+    if state is None:
+        print("No training state saved with the model; fine-tuning on all rows")
+        return all_rows
+    # Only an append-only user_data.csv keeps the earlier row numbers meaningful
+    num_bytes = state["user_data_bytes"]
+    if (os.path.getsize(user_data_path) < num_bytes
+            or file_prefix_digest(user_data_path, num_bytes) != state["user_data_digest"]):
+        print(f"{user_data_path} was rewritten since the last run, not appended to; fine-tuning on all rows")
+        return all_rows
+    return training['user_row'] >= state["num_user_rows"]
+
+def fine_tune_model(movie_data_path, user_data_path, save_path="vae_model.pth", epochs=FINETUNE_EPOCHS,
+                    batch_size=BATCH_SIZE, learning_rate=FINETUNE_LEARNING_RATE, replay_ratio=REPLAY_RATIO,
+                    num_threads=TRAIN_THREADS, seed=None):
+    """Continue training save_path on the user rows added since it was trained.
+
+    Each new row is mixed with replay_ratio randomly chosen older rows so the model
+    does not drift towards the latest users only. Returns the new versioned model
+    path, or None when there is nothing new to train on.
+    """
+    mark = user_data_mark(user_data_path)
+    training = load_training_data(movie_data_path, user_data_path)
+    x_input = training['x_input']
+    state = load_training_state(save_path)
+    # States saved before the version was recorded belong to feature version 1
+    if state is not None and state.get("feature_version", 1) != FEATURE_VERSION:
+        raise ValueError(f"{save_path} was trained on feature version {state.get('feature_version', 1)}, "
+                         f"not {FEATURE_VERSION}; run a full retrain instead")
+
+    is_new = new_row_mask(training, state, user_data_path)
+    new_rows = np.flatnonzero(is_new)
+    if len(new_rows) == 0:
+        print(f"No new user rows since {save_path} was trained")
+        return None
+    old_rows = np.flatnonzero(~is_new)
+    rng = np.random.default_rng(seed)
+    replay_rows = rng.choice(old_rows, size=min(len(old_rows), int(replay_ratio * len(new_rows))), replace=False)
+    rows = np.sort(np.concatenate([new_rows, replay_rows]))
+    print(f"Fine-tuning {save_path} on {len(new_rows)} new and {len(replay_rows)} replayed rows")
+
+    vae = VAE(x_input.shape[1], *HIDDEN_DIMS, LATENT_DIM)
+    try:
+        vae.load_state_dict(torch.load(save_path, map_location=DEVICE))
+    except RuntimeError as e:
+        raise ValueError(f"{save_path} does not fit the current {x_input.shape[1]}-column input "
+                         "(the genre list changed?); run a full retrain instead") from e
+    optimizer = make_optimizer(vae.parameters(), learning_rate)
+    if state is not None:
+        optimizer.load_state_dict(state["optimizer"])
+        for group in optimizer.param_groups:
+            group["lr"] = learning_rate
+
+    train_vae(x_input[rows], epochs=epochs, batch_size=batch_size, learning_rate=learning_rate,
+              num_genres=len(training['genre_list']), num_threads=num_threads, seed=seed,
+              vae=vae, optimizer=optimizer)
+    parent_version = None if state is None else state["version"]
+    return save_trained_model(vae, optimizer, save_path, mark, training['num_user_rows'], parent_version)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the VAE and save its weights")
+    parser.add_argument("--incremental", action="store_true",
+                        help="fine-tune the saved model on the user rows added since it was trained")
+    parser.add_argument("--epochs", type=int, help=f"default {EPOCHS}, or {FINETUNE_EPOCHS} with --incremental")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--replay-ratio", type=float, default=REPLAY_RATIO,
+                        help="older rows replayed per new row with --incremental")
+    parser.add_argument("--threads", type=int, default=TRAIN_THREADS, help="torch threads used for training")
+    args = parser.parse_args()
+
     # Specify paths
     movie_data_path = "data/cleaned_data.csv"
     user_data_path = "data/user_data.csv"
 
     # Train and save model
-    train_and_save_model(movie_data_path, user_data_path)
+    if args.incremental:
+        fine_tune_model(movie_data_path, user_data_path, epochs=args.epochs or FINETUNE_EPOCHS,
+                        batch_size=args.batch_size, replay_ratio=args.replay_ratio, num_threads=args.threads)
+    else:
+        train_and_save_model(movie_data_path, user_data_path, epochs=args.epochs or EPOCHS,
+                             batch_size=args.batch_size, num_threads=args.threads)
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler, MultiLabelBinarizer
+
+from embedding_index import atomic_write, file_digest
+
+# Bump whenever preprocess_data / prepare_features / create_x_input change what they produce
+TRAINING_SNAPSHOT_VERSION = 5
+
+def training_snapshot_path(user_data_path):
+    """The snapshot lives next to the data it was built from."""
+    return os.path.join(os.path.dirname(user_data_path), "training_snapshot.npz")
+
+def input_signature(paths):
+    # Cheap stand-in for the content hash: unchanged size and mtime means unchanged file
+    files = [[os.path.abspath(path), os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths]
+    return {"version": TRAINING_SNAPSHOT_VERSION, "files": files}
+
+def snapshot_key(paths):
+    digest = hashlib.sha256(f"v{TRAINING_SNAPSHOT_VERSION}".encode())
+    for path in paths:
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+def scaler_state(prefix, scaler):
+    return {f"{prefix}_data_min": scaler.data_min_, f"{prefix}_data_max": scaler.data_max_}
+
+def restore_scaler(snapshot, prefix):
+    # Fitting on the stored extremes reproduces every fitted attribute exactly
+    scaler = MinMaxScaler()
+    scaler.fit(np.vstack([snapshot[f"{prefix}_data_min"], snapshot[f"{prefix}_data_max"]]))
+    return scaler
+
+def restore_binarizer(classes):
+    binarizer = MultiLabelBinarizer(classes=list(classes))
+    binarizer.fit([])
+    return binarizer
+
+def save_snapshot(path, paths, x_input, user_ids, tconsts, user_rows, num_user_rows, fitted_state, genre_list,
+                  key=None):
+    """Write the training matrix, its row provenance, its genre columns and the fitted transformers.
+
+    user_rows holds each training row's row number in user_data.csv, which had num_user_rows rows.
+    """
+    key = snapshot_key(paths) if key is None else key
+    arrays = {
+        "key": np.array(key),
+        "signature": np.array(json.dumps(input_signature(paths))),
+        "x_input": np.ascontiguousarray(x_input, dtype=np.float32),
+        "user_id": np.asarray(user_ids),
+        "tconst": np.asarray(tconsts, dtype=str),
+        "user_row": np.asarray(user_rows, dtype=np.int64),
+        "num_user_rows": np.array(num_user_rows, dtype=np.int64),
+        "genre_list": np.asarray(genre_list, dtype=str),
+        "genre_classes": np.asarray(fitted_state["genre_binarizer"].classes_, dtype=str),
+        "user_genre_classes": np.asarray(fitted_state["user_genre_binarizer"].classes_, dtype=str),
+    }
+    arrays.update(scaler_state("movie_scaler", fitted_state["movie_scaler"]))
+    arrays.update(scaler_state("user_rating_scaler", fitted_state["user_rating_scaler"]))
+    atomic_write(path, lambda f: np.savez(f, **arrays))
+
+def load_snapshot(path, paths):
+    """Return the snapshot as a dict if it was built from the current input files, else None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as snapshot:
+            # Only hash the inputs when their size or mtime moved since the snapshot
+            if json.loads(str(snapshot["signature"])) != input_signature(paths):
+                if str(snapshot["key"]) != snapshot_key(paths):
+                    return None
+            return {
+                "x_input": snapshot["x_input"],
+                "user_id": snapshot["user_id"],
+                "tconst": snapshot["tconst"],
+                "user_row": snapshot["user_row"],
+                "num_user_rows": int(snapshot["num_user_rows"]),
+                "genre_list": snapshot["genre_list"].tolist(),
+                "movie_scaler": restore_scaler(snapshot, "movie_scaler"),
+                "user_rating_scaler": restore_scaler(snapshot, "user_rating_scaler"),
+                "genre_binarizer": restore_binarizer(snapshot["genre_classes"]),
+                "user_genre_binarizer": restore_binarizer(snapshot["user_genre_classes"]),
+            }
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable training snapshot {path}: {e}")
+        return None
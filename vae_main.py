@@ -1,142 +1,378 @@
+import copy
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
 import numpy as np
-import pandas as pd
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-from torch.utils.data import DataLoader, random_split, TensorDataset
-from sklearn.preprocessing import MinMaxScaler, MultiLabelBinarizer, LabelEncoder
-from sklearn.metrics.pairwise import cosine_similarity
-import torch.optim as optim
-
-# Check for GPU availability
-DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"🚀 Using device: {DEVICE}")
+
+# pandas, sklearn and the CSV readers are imported by the functions that load the catalog,
+# so importing this module (and with it the web app) stays cheap and the server can
+# start listening while the catalog loads in the background
+from ann_index import IVFIndex, ivf_index_path
+from catalog_filters import CatalogFilters, GenreIndex
+from metrics import Counter, Gauge, Histogram
+from embedding_index import (embedding_index_path, index_key, load_index, load_normalized_rows,
+                             normalized_rows_path, save_index, save_normalized_rows)
+from micro_batcher import MicroBatcher
+from numpy_encoder import NumpyEncoder, encoder_export_current, export_encoder_weights, load_numpy_encoder
+from result_cache import LRUCache
+from similarity import CosineScorer, QuantizedScorer, normalize_rows
+from title_columns import TitleColumns
 
 MOVIE_DATA_PATH = "data/cleaned_data.csv"
 USER_DATA_PATH = "data/user_data.csv"
+MODEL_PATH = "vae_model.pth"
+DEFAULT_USER_RATING = 0.5
+INFERENCE_BACKEND = "numpy" # "numpy" serves without importing torch; "torch" loads the full VAE
+SEARCH_MODE = "exact" # "exact" brute force or "ivf" approximate nearest neighbours
+IVF_NPROBE = 8 # lists scanned per query in "ivf" mode; higher is slower with better recall
+EMBEDDING_PRECISION = "float32" # "exact" mode scans "float32", or "float16"/"int8" then re-scores a shortlist
+RESULT_CACHE_SIZE = 4096 # recommendation results kept in memory; 0 disables the cache
+RESULT_CACHE_TTL = None # seconds before a cached result expires; None keeps it until evicted
+INPUT_QUANTUM = 10000 # scaled rating/votes are rounded to 1/INPUT_QUANTUM before use
+MICRO_BATCHING = True # score concurrent requests together in one encoder pass
+MICRO_BATCH_SIZE = 64 # most queries per batch
+MICRO_BATCH_WINDOW = 0.002 # most seconds a batch waits for queries already on their way; a lone query never waits
 LATENT_DIM = 10
+CONTINUOUS_FEATURES = ['averageRating', 'numVotes', 'UserRating'] # follow the genre flags in every input row
 HIDDEN_DIMS = [512, 256, 128, 64, 32]
+FEATURE_VERSION = 2 # bump when the encoder input rows change meaning; older models need a full retrain
 
 # --- GLOBAL DATA/MODEL LOADING FOR SPEED ---
 data, user_data, _, movie_encoder = None, None, None, None
-genre_list, movie_features = None, None
+genre_list, movie_features, movie_genres = None, None, None
 vae = None
+movie_embeddings, movie_scorer = None, None
+catalog_filters, genre_index = None, None
+title_columns = None
+model_version = None
+result_cache = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+# Initialization state, reported by the /readyz endpoint
+init_lock = threading.RLock()
+init_status = "not_started" # "not_started", "loading", "ready" or "failed"
+init_error = None
+startup_timings = {}
+
+# Serving metrics, exposed in text format by the /metrics endpoint
+stage_seconds = Histogram("recommendation_stage_seconds", "Time spent in each stage of a recommendation",
+                          ["stage"])
+cache_lookups = Counter("recommendation_cache_lookups_total", "Result cache lookups by result", ["result"])
+startup_phase_seconds = Gauge("startup_phase_seconds", "Duration of each phase of the last successful load",
+                              ["phase"])
+catalog_titles = Gauge("catalog_titles", "Titles in the loaded catalog")
+catalog_user_rows = Gauge("catalog_user_rows", "User rating rows in the loaded data")
+catalog_embedding_dim = Gauge("catalog_embedding_dim", "Dimension of the movie embeddings")
+
+@contextmanager
+def startup_phase(timings, name):
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+    print(f"Startup: {name} took {timings[name]:.2f}s")
+
+def initialize_globals(encode_in_subprocess=False):
+    """Load the catalog, model and movie embeddings and publish them for serving.
+
+    With encode_in_subprocess, a missing embedding index is encoded in a spawned process
+    (see preload_for_fork).
+    """
+    global data, user_data, movie_encoder, genre_list, movie_features, movie_genres, vae, movie_embeddings
+    global movie_scorer
+    global catalog_filters, genre_index, title_columns, model_version, init_status, init_error, startup_timings
+    with init_lock:
+        init_status, init_error = "loading", None
+        timings = {}
+        try:
+            fitted_state = {}
+            with startup_phase(timings, "load_data"):
+                new_data, new_user_data, _, new_movie_encoder = preprocess_data(MOVIE_DATA_PATH, USER_DATA_PATH,
+                                                                                fitted_state=fitted_state)
+            with startup_phase(timings, "prepare_features"):
+                new_genre_list, _, new_movie_features, new_movie_genres = prepare_features(new_data, new_user_data)
+            with startup_phase(timings, "filters"):
+                new_catalog_filters = build_catalog_filters(new_data, fitted_state['movie_scaler'])
+                new_genre_index = GenreIndex(new_data[new_genre_list].eq(1).to_numpy(), new_genre_list)
+            with startup_phase(timings, "title_columns"):
+                new_title_columns = build_title_columns(new_data)
+            # Settings are passed explicitly so changes to the module constants take effect
+            with startup_phase(timings, "load_model"):
+                vae_model = load_encoder_model(len(new_genre_list) + 3, INFERENCE_BACKEND, MODEL_PATH)
+            with startup_phase(timings, "movie_embeddings"):
+                new_movie_embeddings, key = load_or_build_movie_embeddings(
+                    new_movie_features, new_movie_genres, vae_model, DEFAULT_USER_RATING, MODEL_PATH, MOVIE_DATA_PATH,
+                    encode_in_subprocess
+                )
+            with startup_phase(timings, "scorer"):
+                new_movie_scorer = build_movie_scorer(new_movie_embeddings, key, SEARCH_MODE, MODEL_PATH,
+                                                      EMBEDDING_PRECISION)
+            if isinstance(new_movie_scorer, QuantizedScorer):
+                # The scorer keeps its own compact copy and reads full-precision rows from disk
+                new_movie_embeddings = None
+        except Exception as e:
+            init_status, init_error = "failed", f"{type(e).__name__}: {e}"
+            raise
+
+        # Publish everything at once so requests never see a half-loaded model
+        (data, user_data, movie_encoder, genre_list, movie_features, movie_genres, vae, movie_embeddings,
+         movie_scorer, catalog_filters, genre_index, title_columns) = (
+            new_data, new_user_data, new_movie_encoder, new_genre_list, new_movie_features, new_movie_genres,
+            vae_model, new_movie_embeddings, new_movie_scorer, new_catalog_filters, new_genre_index, new_title_columns
+        )
+        # The embedding key covers both the model weights and the catalog
+        model_version = key
+        result_cache.clear()
+        startup_timings = timings
+        for phase, seconds in timings.items():
+            startup_phase_seconds.set(seconds, phase)
+        catalog_titles.set(len(data))
+        catalog_user_rows.set(len(user_data))
+        catalog_embedding_dim.set(LATENT_DIM)
+        init_status = "ready"
+        print(f"Startup: ready in {sum(timings.values()):.2f}s")
+
+def ensure_initialized():
+    """Load the globals once; concurrent callers wait for the first load instead of repeating it."""
+    if globals_ready():
+        return
+    with init_lock:
+        if not globals_ready():
+            initialize_globals()
+
+def readiness():
+    return {
+        "ready": globals_ready(),
+        "status": init_status,
+        "error": init_error,
+        "startup_timings": dict(startup_timings),
+    }
+
+def configure_worker_threads(num_threads):
+    """Cap this process's BLAS and torch thread pools at num_threads.
+
+    Several serving or sweep processes share the CPU, so each keeps its pools small
+    rather than every process starting one thread per core. Pools must also never exist
+    in a process that forks: a child forked after they started can deadlock. Work that
+    would start them in such a process runs in a spawned one instead (run_in_subprocess).
+    """
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(num_threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(num_threads)
+
+def run_in_subprocess(function, *args):
+    # spawn, not fork, and only the result comes back (see configure_worker_threads)
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(function, *args).result()
+
+def encode_with_exported_encoder(features, model_path):
+    return encode_features(load_numpy_encoder(model_path), features)
+
+def preload_for_fork():
+    """Load everything once in a pre-fork parent without running the model there.
+
+    The parent only reads arrays and weights, so it starts no thread pools before it
+    forks (see configure_worker_threads): exporting the encoder and encoding a missing
+    embedding index happen in a spawned process.
+    """
+    if INFERENCE_BACKEND != "numpy":
+        raise ValueError(f"Preloading before fork needs the numpy inference backend, not {INFERENCE_BACKEND!r}")
+    # Any BLAS call the parent still makes (e.g. building an IVF index) stays on its own thread
+    configure_worker_threads(1)
+    with init_lock:
+        if globals_ready():
+            return
+        if not encoder_export_current(MODEL_PATH):
+            run_in_subprocess(export_encoder_weights, MODEL_PATH)
+        initialize_globals(encode_in_subprocess=True)
+
+def start_background_initialization():
+    # Errors are recorded in init_status/init_error for /readyz rather than raised
+    def run():
+        try:
+            ensure_initialized()
+        except Exception as e:
+            print(f"Startup failed: {e}")
+    thread = threading.Thread(target=run, name="initialize-globals", daemon=True)
+    thread.start()
+    return thread
+
+def build_catalog_filters(data, movie_scaler):
+    """Sorted indexes over the unscaled rating, votes and start year, plus each title's titleType."""
+    numerical_cols = ['startYear', 'averageRating', 'numVotes']  # the order the scaler was fitted in
+    raw = movie_scaler.inverse_transform(data[numerical_cols].to_numpy(dtype=np.float64, na_value=np.nan))
+    # Undo the float error of the round trip so that e.g. a 7.0 rating passes min_rating=7
+    start_year, average_rating, num_votes = np.round(raw[:, 0]), np.round(raw[:, 1], 1), np.round(raw[:, 2])
+    type_columns = [col for col in data.columns if str(col).startswith('titleType_')]
+    type_flags = data[type_columns].eq(1).to_numpy()
+    type_codes = np.where(type_flags.any(axis=1), type_flags.argmax(axis=1), -1)
+    return CatalogFilters(
+        {'startYear': start_year, 'averageRating': average_rating, 'numVotes': num_votes},
+        {'titleType': (type_codes, [col[len('titleType_'):] for col in type_columns])},
+    )
 
-def initialize_globals():
-    global data, user_data, movie_encoder, genre_list, movie_features, vae
-    data, user_data, _, movie_encoder = preprocess_data(MOVIE_DATA_PATH, USER_DATA_PATH)
-    genre_list, _, movie_features = prepare_features(data, user_data)
-    input_dim = len(genre_list) + 3
-    vae_model = VAE(input_dim, *HIDDEN_DIMS, LATENT_DIM)
-    vae_model.load_state_dict(torch.load("vae_model.pth", map_location=DEVICE))
-    vae_model.eval()
-    vae_model.to(DEVICE)
-    vae = vae_model
+def build_title_columns(data):
+    # primaryTitle holds the label-encoded title, so rows with the same title share a code
+    tconsts = data['tconst'].astype(object)
+    return TitleColumns(
+        tconsts.where(tconsts.notna(), None).to_numpy(),
+        data['original_title'].astype(object).to_numpy(),
+        data['genres'].astype(object).to_numpy(),
+        [genres if isinstance(genres, list) else [] for genres in data['genre_list']],
+        data['primaryTitle'].to_numpy(),
+    )
+
+def filter_candidates(filters, genres_selected=()):
+    """Sorted row ids that pass the hard filters, or None when there are none.
+
+    filters may hold min_rating, min_votes, year_from, year_to (all inclusive),
+    title_types (titleType values to keep), genres_any, genres_all and
+    genres_exclude (genre names), and min_genre_overlap: the least number of
+    genres_selected a title must have.
+    """
+    if not filters:
+        return None
+    rows = catalog_filters.candidates(
+        ranges={'averageRating': (filters.get('min_rating'), None),
+                'numVotes': (filters.get('min_votes'), None),
+                'startYear': (filters.get('year_from'), filters.get('year_to'))},
+        categories={'titleType': filters.get('title_types')},
+    )
+    return genre_index.candidates(any_of=filters.get('genres_any'), all_of=filters.get('genres_all'),
+                                  exclude=filters.get('genres_exclude'), overlap=genres_selected,
+                                  min_overlap=filters.get('min_genre_overlap'), rows=rows)
+
+def filters_key(filters):
+    # Hashable form of the filters for the result cache key
+    if not filters:
+        return None
+    return tuple(sorted((name, tuple(sorted(value)) if isinstance(value, (list, tuple)) else value)
+                        for name, value in filters.items() if value is not None))
+
+def load_or_build_movie_embeddings(movie_features, movie_genres, vae, user_rating,
+                                   model_path=MODEL_PATH, catalog_path=MOVIE_DATA_PATH, encode_in_subprocess=False):
+    # Movie embeddings only depend on the model weights and the catalog, so encode
+    # the catalog once and reuse the persisted result until either of them changes
+    index_path = embedding_index_path(model_path)
+    key = index_key(model_path, catalog_path, user_rating)
+    tconsts = movie_features['tconst'].to_numpy()
+    embeddings = load_index(index_path, key, tconsts)
+    if embeddings is not None:
+        print(f"Loaded {len(embeddings)} movie embeddings from {index_path}")
+        return embeddings, key
+    if encode_in_subprocess:
+        features = movie_feature_matrix(movie_features, movie_genres, user_rating, model_input_dim(vae) - 3)
+        embeddings = run_in_subprocess(encode_with_exported_encoder, features, model_path)
+    else:
+        embeddings = get_movie_embeddings(movie_features, movie_genres, vae, user_rating)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    # Row i of the index must be the embedding of tconsts[i]; every later row id relies on it
+    if len(embeddings) != len(tconsts):
+        raise ValueError(f"Encoded {len(embeddings)} movie embeddings for {len(tconsts)} titles")
+    save_index(index_path, key, embeddings, tconsts)
+    print(f"Saved {len(embeddings)} movie embeddings to {index_path}")
+    return embeddings, key
+
+def build_movie_scorer(movie_embeddings, key, search_mode=SEARCH_MODE, model_path=MODEL_PATH,
+                       precision=EMBEDDING_PRECISION):
+    if search_mode == "exact" and precision == "float32":
+        return CosineScorer(movie_embeddings)
+    if search_mode == "exact":
+        # Re-scoring reads the shortlisted rows from a memory-mapped file, so only
+        # the compact copy is held in each worker's memory
+        rows_path = normalized_rows_path(model_path, key)
+        rows = load_normalized_rows(rows_path, len(movie_embeddings))
+        if rows is None:
+            save_normalized_rows(rows_path, normalize_rows(movie_embeddings))
+            rows = load_normalized_rows(rows_path, len(movie_embeddings))
+        scorer = QuantizedScorer(rows, precision, normalized=True)
+        print(f"Scoring {len(scorer)} {precision} embeddings ({scorer.codes.nbytes} bytes, "
+              f"float32 would be {rows.nbytes})")
+        return scorer
+    if search_mode == "ivf":
+        # The IVF index is derived from the embeddings, so it shares their key
+        index_path = ivf_index_path(model_path)
+        index = IVFIndex.load(index_path, key=key, nprobe=IVF_NPROBE)
+        if index is None:
+            index = IVFIndex.build(movie_embeddings, nprobe=IVF_NPROBE, key=key)
+            index.save(index_path)
+            print(f"Saved IVF index with {len(index.centroids)} lists to {index_path}")
+        return index
+    raise ValueError(f"Unknown search mode: {search_mode}")
 
 # BACKEND CODE
-class Encoder(nn.Module):
-    def __init__(self, input_dim, hidden_dim1, hidden_dim2, hidden_dim3, hidden_dim4, hidden_dim5, latent_dim):
-        super(Encoder, self).__init__()
-        self.fc1 = nn.Linear(input_dim, hidden_dim1)
-        self.fc2 = nn.Linear(hidden_dim1, hidden_dim2)
-        self.fc3 = nn.Linear(hidden_dim2, hidden_dim3)
-        self.fc4 = nn.Linear(hidden_dim3, hidden_dim4)
-        self.fc5 = nn.Linear(hidden_dim4, hidden_dim5)
-        self.fc_mu = nn.Linear(hidden_dim5, latent_dim)
-        self.fc_log_var = nn.Linear(hidden_dim5, latent_dim)
-
-    def forward(self, x):
-        x = F.relu(self.fc1(x))
-        x = F.relu(self.fc2(x))
-        x = F.relu(self.fc3(x))
-        x = F.relu(self.fc4(x))
-        x = F.relu(self.fc5(x))
-        mu = self.fc_mu(x)
-        log_var = self.fc_log_var(x)
-        return mu, log_var
-
-class Decoder(nn.Module):
-    def __init__(self, input_dim, hidden_dim1, hidden_dim2, hidden_dim3, hidden_dim4, hidden_dim5, latent_dim):
-        super(Decoder, self).__init__()
-        self.fc1 = nn.Linear(latent_dim, hidden_dim5)
-        self.fc2 = nn.Linear(hidden_dim5, hidden_dim4)
-        self.fc3 = nn.Linear(hidden_dim4, hidden_dim3)
-        self.fc4 = nn.Linear(hidden_dim3, hidden_dim2)
-        self.fc5 = nn.Linear(hidden_dim2, hidden_dim1)
-        self.fc_out = nn.Linear(hidden_dim1, input_dim)
-
-    def forward(self, z):
-        z = F.relu(self.fc1(z))
-        z = F.relu(self.fc2(z))
-        z = F.relu(self.fc3(z))
-        z = F.relu(self.fc4(z))
-        z = F.relu(self.fc5(z))
-        return torch.sigmoid(self.fc_out(z))
-
-class VAE(nn.Module):
-    def __init__(self, input_dim, hidden_dim1, hidden_dim2, hidden_dim3, hidden_dim4, hidden_dim5, latent_dim):
-        super(VAE, self).__init__()
-        self.encoder = Encoder(input_dim, hidden_dim1, hidden_dim2, hidden_dim3, hidden_dim4, hidden_dim5, latent_dim)
-        self.decoder = Decoder(input_dim, hidden_dim1, hidden_dim2, hidden_dim3, hidden_dim4, hidden_dim5, latent_dim)
-        self.to(DEVICE)  # Move model to GPU if available
-
-    def reparameterize(self, mu, log_var):
-        std = torch.exp(0.5 * log_var)
-        epsilon = torch.randn_like(std)
-        return mu + epsilon * std
-
-    def forward(self, x):
-        mu, log_var = self.encoder(x)
-        z = self.reparameterize(mu, log_var)
-        x_reconstructed = self.decoder(z)
-        return x_reconstructed, mu, log_var
-
-def loss_function(recon_x, x, mu, logvar, binary_mask, continuous_mask, beta=1.0):
-    # Binary Cross-Entropy for binary features
-    binary_x = x[:, binary_mask]  # Select binary features
-    recon_binary_x = recon_x[:, binary_mask]  # Reconstructed binary features
-    binary_recon_loss = F.binary_cross_entropy(recon_binary_x, binary_x, reduction='sum')
-
-    # Mean Squared Error for continuous features
-    continuous_x = x[:, continuous_mask]  # Select continuous features
-    recon_continuous_x = recon_x[:, continuous_mask]  # Reconstructed continuous features
-    continuous_recon_loss = F.mse_loss(recon_continuous_x, continuous_x, reduction='sum')
-
-    # Combine the reconstruction losses (you can scale continuous loss if necessary)
-    total_recon_loss = binary_recon_loss + beta * continuous_recon_loss
-
-    # KL Divergence Loss
-    kl_loss = -0.5 * torch.sum(1 + logvar - mu.pow(2) - logvar.exp())
-
-    # Total Loss = Reconstruction Loss + KL Divergence
-    total_loss = total_recon_loss + kl_loss
-    return total_loss
-
-def preprocess_data(movie_data_path, user_data_path):
-    data = pd.read_csv(movie_data_path)
-    user_data = pd.read_csv(user_data_path)
-
-    data['startYear'] = pd.to_numeric(data['startYear'], errors='coerce')
-    numerical_cols = ['startYear', 'averageRating', 'numVotes']
-    for col in numerical_cols:
-        data[col].fillna(data[col].median(), inplace=True)
+# The torch model and training code live in vae_network; they are only imported when used
+_VAE_NETWORK_NAMES = {"DEVICE", "Encoder", "Decoder", "VAE", "loss_function", "train_vae"}
+
+def __getattr__(name):
+    if name in _VAE_NETWORK_NAMES:
+        import vae_network
+        return getattr(vae_network, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def load_encoder_model(input_dim, backend=INFERENCE_BACKEND, model_path=MODEL_PATH):
+    if backend == "numpy":
+        return load_numpy_encoder(model_path)
+    if backend == "torch":
+        import torch
+        from vae_network import DEVICE, VAE
+        vae_model = VAE(input_dim, *HIDDEN_DIMS, LATENT_DIM)
+        vae_model.load_state_dict(torch.load(model_path, map_location=DEVICE))
+        vae_model.eval()
+        vae_model.to(DEVICE)
+        return vae_model
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+def model_input_dim(vae):
+    if isinstance(vae, NumpyEncoder):
+        return vae.in_features
+    return vae.encoder.fc1.in_features
+
+def encode_features(vae, features):
+    """mu for a float32 feature matrix, from either the NumPy encoder or the torch VAE."""
+    if isinstance(vae, NumpyEncoder):
+        return vae.mu(features)
+    import torch
+    from vae_network import DEVICE
+    vae.eval()
+    with torch.no_grad():
+        # from_numpy shares the array's memory
+        mu, _ = vae.encoder(torch.from_numpy(features).to(DEVICE))
+    return mu.cpu().numpy()
+
+def preprocess_data(movie_data_path, user_data_path, fitted_state=None):
+    import pandas as pd
+    from sklearn.preprocessing import MinMaxScaler, MultiLabelBinarizer, LabelEncoder
+    from data_ingest import parse_genre_lists, read_movie_data, read_user_data
+
+    # fitted_state, if given, receives copies of the transformers as they are fitted
+    def keep_fitted(name, transformer):
+        if fitted_state is not None:
+            fitted_state[name] = copy.deepcopy(transformer)
 
-    categorical_cols = ['titleType', 'genres', 'directorNames', 'writerNames', 'isAdult']
-    for col in categorical_cols:
-        data[col].fillna('Unknown', inplace=True)
+    # Streamed in chunks: missing values are filled and startYear > 2000 is applied while reading
+    data = read_movie_data(movie_data_path)
+    user_data = read_user_data(user_data_path)
 
-    data = data[data['startYear'] > 2000]
+    numerical_cols = ['startYear', 'averageRating', 'numVotes']
     data = data.dropna(subset=['primaryTitle', 'averageRating', 'numVotes'])
     data['original_title'] = data['primaryTitle'].copy()
 
     scaler = MinMaxScaler()
     data[numerical_cols] = scaler.fit_transform(data[numerical_cols])
+    keep_fitted('movie_scaler', scaler)
     data = pd.get_dummies(data, columns=['titleType', 'isAdult'], prefix=['titleType', 'isAdult'])
 
-    data['genre_list'] = data['genres'].apply(lambda x: eval(x) if isinstance(x, str) else x)
+    data['genre_list'] = parse_genre_lists(data['genres'])
     multi_label_encoder = MultiLabelBinarizer()
     genres_encoded = multi_label_encoder.fit_transform(data['genre_list'])
-    genres_encoded_df = pd.DataFrame(genres_encoded, columns=multi_label_encoder.classes_)
+    keep_fitted('genre_binarizer', multi_label_encoder)
+    # Aligned on data's own index: the startYear filter leaves gaps in it, and a
+    # default 0..n-1 index would pair titles with other titles' genre flags
+    genres_encoded_df = pd.DataFrame(genres_encoded, columns=multi_label_encoder.classes_, index=data.index)
     data = pd.concat([data, genres_encoded_df], axis=1)
 
     movie_encoder = LabelEncoder()
@@ -145,9 +381,12 @@ def preprocess_data(movie_data_path, user_data_path):
     data['primaryTitle'] = movie_encoder.fit_transform(data['primaryTitle'])
 
     user_data['UserRating'] = scaler.fit_transform(user_data[['UserRating']])
-    user_data['user_genre_list'] = user_data['FavoriteGenres'].apply(lambda x: eval(x) if isinstance(x, str) else x)
+    keep_fitted('user_rating_scaler', scaler)
+    user_data['user_genre_list'] = parse_genre_lists(user_data['FavoriteGenres'])
     user_genres_encoded = multi_label_encoder.fit_transform(user_data['user_genre_list'])
-    user_genres_encoded_df = pd.DataFrame(user_genres_encoded, columns=multi_label_encoder.classes_)
+    keep_fitted('user_genre_binarizer', multi_label_encoder)
+    user_genres_encoded_df = pd.DataFrame(user_genres_encoded, columns=multi_label_encoder.classes_,
+                                          index=user_data.index)
     user_data = pd.concat([user_data, user_genres_encoded_df], axis=1)
 
     user_encoder = LabelEncoder()
@@ -159,161 +398,128 @@ def preprocess_data(movie_data_path, user_data_path):
     return data, user_data, multi_label_encoder, movie_encoder
 
 def prepare_features(data, user_data):
+    """genre_list, the merged user/movie training rows, the movie features, and the genre flags.
+
+    The genre flags are one int8 matrix with a row per movie; movie_features and the
+    merged rows point into it through their movie_row column.
+    """
+    import pandas as pd
+
     genre_list = [col for col in data.columns if col not in ['tconst', 'primaryTitle', 'startYear', 'genres', 'directorNames',
                                                              'writerNames', 'averageRating', 'numVotes', 'titleType_movie',
                                                              'isAdult_0', 'isAdult_1', 'genre_list', 'original_title']]
     movie_features = pd.concat([data[['tconst', 'averageRating', 'numVotes', 'original_title']]], axis=1)
-    if genre_list:
-        movie_features['genres_list'] = data[genre_list].apply(
-            lambda genres: [1 if genres[genre] == 1 else 0 for genre in genre_list], axis=1
-        )
-    else:
-        movie_features['genres_list'] = [[] for _ in range(len(movie_features))]
+    movie_features['movie_row'] = np.arange(len(movie_features))
+    movie_genres = np.ascontiguousarray(data[genre_list].eq(1).to_numpy(dtype=np.int8).reshape(len(data), -1))
     user_features = pd.concat([user_data[['tconst', 'UserID', 'UserRating']]], axis=1)
+    # Row number in user_data.csv, so incremental training can tell which rows are new
+    user_features['user_row'] = np.arange(len(user_features))
     merged_data = pd.merge(user_features, movie_features, on='tconst', how='inner')
     merged_data.fillna(0, inplace=True)
-    return genre_list, merged_data, movie_features
-
-def create_x_input(merged_data):
-    # Construct x_input
-    x_input = []
-    for index, row in merged_data.iterrows():
-        x_input.append(list(row['genres_list']) + [row['averageRating'], row['numVotes'], row['UserRating']])
+    return genre_list, merged_data, movie_features, movie_genres
+
+def create_x_input(merged_data, movie_genres):
+    # Construct x_input: genre one-hots + averageRating + numVotes + UserRating per row
+    num_genres = movie_genres.shape[1]
+    x_input = np.empty((len(merged_data), num_genres + len(CONTINUOUS_FEATURES)), dtype=np.float32)
+    x_input[:, :num_genres] = movie_genres[merged_data['movie_row'].to_numpy(dtype=np.int64)]
+    x_input[:, num_genres:] = merged_data[CONTINUOUS_FEATURES].to_numpy(dtype=np.float32)
     return x_input
 
-def train_vae(x_input, epochs=50, batch_size=64, learning_rate=1e-3):
-    merged_data_tensor = torch.tensor(x_input, dtype=torch.float32)
-    dataset = TensorDataset(merged_data_tensor)
-    train_size = int(0.8 * len(dataset))
-    val_size = len(dataset) - train_size
-    train_dataset, val_dataset = random_split(dataset, [train_size, val_size])
-    
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False)
-
-    input_dim = merged_data_tensor.shape[1]
-    BIN_MASK = torch.tensor([True, True, True, True, True, True, True, True, True, True,
-                        True, True, True, True, True, True, True, True, True, True, True,True,True,True,True,True,
-                        False, False, False])
-    CONT_MASK = torch.tensor([False, False, False, False, False, False, False, False, False, False,
-                          False, False, False, False, False, False, False, False, False, False, False, False,False, False,False, False,
-                        True, True, True])
-
-    vae = VAE(input_dim, *HIDDEN_DIMS, LATENT_DIM)
-    optimizer = optim.Adam(vae.parameters(), lr=learning_rate)
-
-    for epoch in range(epochs):
-        total_loss = 0
-        vae.train()
-        for batch in train_loader:
-            batch = batch[0]
-            optimizer.zero_grad()
-            recon_batch, mu, logvar = vae(batch)
-            loss = loss_function(recon_batch, batch, mu, logvar, BIN_MASK, CONT_MASK)
-            loss.backward()
-            total_loss += loss.item()
-            optimizer.step()
-        print(f"Epoch {epoch + 1}, Loss: {total_loss / len(train_loader.dataset):.4f}")
-
-    return vae
-
 def get_user_embeddings(user_rating, movie_features_sample, vae):
-    vae.eval()
-    with torch.no_grad():
-        input_vector = torch.tensor(movie_features_sample + [user_rating], dtype=torch.float32).to(DEVICE)
-        _, mu, _ = vae(input_vector)
-    return mu.cpu().numpy()
-
-def get_movie_embeddings(movie_features, vae, user_rating):
-    vae.eval()
-    movie_embeddings = []
-
-    movie_features = movie_features.fillna(0)  # Ensure no NaN
-
-    # Prepare all movie inputs as a batch
-    movie_inputs = []
-    valid_indices = []
-    
-    for index, row in movie_features.iterrows():
-        try:
-            movie_input = torch.tensor(row['genres_list'] + [row['averageRating'], row['numVotes'], user_rating], dtype=torch.float32)
-            movie_inputs.append(movie_input)
-            valid_indices.append(index)
-        except Exception as e:
-            print(f"Error processing row {index}: {e}")
-
-    if not movie_inputs:
-        return []
+    input_vector = np.array([movie_features_sample + [user_rating]], dtype=np.float32)
+    return encode_features(vae, input_vector)[0]
+
+def movie_feature_matrix(movie_features, movie_genres, user_rating, genre_dim):
+    # Genre one-hots + averageRating + numVotes + user rating as one contiguous float32 array,
+    # with one row per movie_features row
+    if movie_genres.shape != (len(movie_features), genre_dim):
+        raise ValueError(f"Expected {len(movie_features)} x {genre_dim} genre flags, got {movie_genres.shape}")
+    features = np.empty((len(movie_features), genre_dim + 3), dtype=np.float32)
+    features[:, :genre_dim] = movie_genres
+    features[:, genre_dim:genre_dim + 2] = movie_features[['averageRating', 'numVotes']].to_numpy(
+        dtype=np.float32, na_value=0.0)
+    features[:, genre_dim + 2] = user_rating
+    return features
+
+def get_movie_embeddings(movie_features, movie_genres, vae, user_rating):
+    genre_dim = model_input_dim(vae) - 3
+    features = movie_feature_matrix(movie_features, movie_genres, user_rating, genre_dim)
+
+    if len(features) == 0:
+        return np.empty((0, LATENT_DIM), dtype=np.float32)
 
     # Process all movies in a single batch
-    with torch.no_grad():
-        try:
-            # Stack all inputs into a single tensor and move to device
-            batch_inputs = torch.stack(movie_inputs).to(DEVICE)
-            
-            # Get embeddings for the entire batch at once
-            mu, _ = vae.encoder(batch_inputs)
-            
-            # Convert to numpy and return
-            movie_embeddings = mu.cpu().numpy()
-            
-        except Exception as e:
-            print(f"Error in batch processing: {e}")
-            # Fallback to individual processing
-            movie_embeddings = []
-            for movie_input in movie_inputs:
-                try:
-                    movie_input = movie_input.to(DEVICE)
-                    mu, _ = vae.encoder(movie_input.unsqueeze(0))
-                    movie_embeddings.append(mu.squeeze(0).cpu().numpy())
-                except Exception as e:
-                    print(f"Error in fallback processing: {e}")
-
-    return movie_embeddings
-
-def generate_recommendations(user_rating, movie_features, movie_features_sample, vae, data, movie_encoder, top_n=5):
-    vae.eval()
-    with torch.no_grad():
-
-        # Get embeddings
-        print("get embeddings")
+    return encode_features(vae, features)
 
+def generate_recommendations(user_rating, movie_features, movie_features_sample, vae, columns, movie_encoder,
+                             top_n=5, movie_embeddings=None, scorer=None, candidates=None):
+    # Get embeddings
+    with stage_seconds.time("user_embedding"):
         user_embeddings = get_user_embeddings(user_rating, movie_features_sample, vae).reshape(1, -1)
-        movie_embeddings = np.vstack(get_movie_embeddings(movie_features, vae, user_rating))
-
-        print("generating indices")
-       
-        # Compute similarity
-        similarity_scores = cosine_similarity(user_embeddings, movie_embeddings).flatten()
-        top_indices = np.argsort(similarity_scores)[::-1][:top_n]
-        recommended_movies = data.iloc[top_indices].copy()
-        recommended_movies['similarity_score'] = similarity_scores[top_indices]
-
-        print("done with similarity scores")
-
-        # Ensure distinct recommendations
-        recommended_movies = recommended_movies.drop_duplicates(subset=['primaryTitle'])
-
-        # Use original titles directly
-        try:
-            recommended_movies['decoded_title'] = recommended_movies['original_title']
-        except KeyError:
-            # Fallback if original_title column doesn't exist
-            print("Warning: original_title column not found, using fallback titles")
-            recommended_movies['decoded_title'] = [f"Movie {i}" for i in range(len(recommended_movies))]
-
-        # Remove NaN titles
-        recommended_movies = recommended_movies.dropna(subset=['decoded_title'])
-
-        print(f"returning recommendations, found {len(recommended_movies)} movies")
-        
-        # Select top_n distinct movies
-        result = recommended_movies.head(top_n)[['decoded_title', 'similarity_score']].rename(
-            columns={'decoded_title': 'Movie', 'similarity_score': 'Similarity Score'}
-        )
-        
-        print(f"Final result shape: {result.shape}")
-        return result
+    if scorer is None:
+        with stage_seconds.time("movie_embeddings"):
+            if movie_embeddings is None:
+                movie_embeddings = get_movie_embeddings(movie_features, movie_genres, vae, user_rating)
+            scorer = CosineScorer(movie_embeddings)
+
+    # Compute similarity
+    with stage_seconds.time("similarity"):
+        top_indices, top_scores = distinct_top_k(user_embeddings, top_n, candidates, scorer, columns)
+
+    with stage_seconds.time("assembly"):
+        return assemble_recommendations(columns, top_indices, top_scores)
+
+def distinct_top_k(query, n, candidates=None, scorer=None, columns=None, result=None):
+    """The n best rows with distinct titles, as (top_indices, top_scores).
+
+    Rows are fetched best first and more are fetched while duplicate titles crowd
+    some out, so exactly n come back unless the candidates run out. result, if
+    given, is a top_k already fetched for query with at least columns.fetch_size(n) rows.
+    """
+    scorer = movie_scorer if scorer is None else scorer
+    columns = title_columns if columns is None else columns
+    limit = min(columns.fetch_limit(n), len(scorer) if candidates is None else len(candidates))
+    k = columns.fetch_size(n)
+    while True:
+        if result is None:
+            result = scorer.top_k(query, k, candidates=candidates)
+        top_indices, top_scores = result
+        keep = columns.distinct(top_indices, n)
+        k = max(k, len(top_indices))
+        if len(keep) == n or k >= limit:
+            return top_indices[keep], top_scores[keep]
+        k, result = 2 * k, None
+
+def assemble_recommendations(columns, top_indices, top_scores):
+    # Rows for the results page, read from the compact per-row arrays for just the winners
+    titles, genres = columns.titles[top_indices].tolist(), columns.genres[top_indices].tolist()
+    return [{'Rank': rank, 'Movie': title, 'Genre(s)': genre, 'Similarity Score': score}
+            for rank, (title, genre, score) in enumerate(zip(titles, genres, top_scores.tolist()), 1)]
+
+def score_query_batch(queries):
+    # Batch handler for the micro-batcher: one encoder forward and one similarity pass
+    # for every (user_input_vector, top_n, candidates) query that arrived in the window
+    user_inputs = np.array([vector + [DEFAULT_USER_RATING] for vector, _, _ in queries], dtype=np.float32)
+    with stage_seconds.time("batch_user_embedding"):
+        user_embeddings = encode_features(vae, user_inputs)
+    results = [None] * len(queries)
+    unfiltered = [i for i, (_, _, candidates) in enumerate(queries) if candidates is None]
+    with stage_seconds.time("batch_similarity"):
+        batch_results = {}
+        if unfiltered:
+            k = max(title_columns.fetch_size(queries[i][1]) for i in unfiltered)
+            batch_results = dict(zip(unfiltered, movie_scorer.top_k_batch(user_embeddings[unfiltered], k)))
+        # Filtered queries each score only their own candidate rows. A query that fails gets
+        # its exception as its result, so the others sharing the batch still get answers
+        for i, (_, n, candidates) in enumerate(queries):
+            try:
+                results[i] = distinct_top_k(user_embeddings[i], n, candidates, result=batch_results.get(i))
+            except Exception as e:
+                results[i] = e
+    return results
+
+recommendation_batcher = MicroBatcher(score_query_batch, MICRO_BATCH_SIZE, MICRO_BATCH_WINDOW)
 
 def scale_inputs(input1, input2, range1=(0, 10), range2=(0, 1000)):
     # Normalize input1 using range1
@@ -334,29 +540,84 @@ def scale_inputs(input1, input2, range1=(0, 10), range2=(0, 1000)):
 
     return scaled_input1, scaled_input2
 
-def run_for_frontend(genres_selected, avg_rating, num_votes):
-    if any(x is None for x in [data, user_data, movie_encoder, genre_list, movie_features, vae]):
-        initialize_globals()
-    filtered_data = data
-    filtered_movie_features = movie_features
+def genre_bitmask(genres_selected, genres):
+    selected = set(genres_selected)
+    return sum(1 << i for i, genre in enumerate(genres) if genre in selected)
+
+def quantize_inputs(avg_rating, num_votes):
+    # Queries that only differ below the quantum share a cache entry, and the model
+    # sees the quantized values so a cached result is exactly what it would compute
     scaled_avg_rating, scaled_votes_num = scale_inputs(float(avg_rating), float(num_votes))
-    user_input_vector = [1 if genre in genres_selected else 0 for genre in genre_list] + [scaled_avg_rating, scaled_votes_num]
-    user_rating = 0.5
-    output = generate_recommendations(
-        user_rating,
-        filtered_movie_features,
-        user_input_vector,
-        vae,
-        filtered_data,
-        movie_encoder,
-        top_n=5
-    )
-    # Add genre to output, merge on decoded movie title
-    if not output.empty:
-        output = output.merge(filtered_data[['original_title', 'genres']], left_on='Movie', right_on='original_title', how='left')
-        output = output.drop(columns=['original_title'])
-        output['Rank'] = range(1, len(output) + 1)
-        output = output[['Rank', 'Movie', 'genres', 'Similarity Score']]
-        output = output.rename(columns={'genres': 'Genre(s)'})
-        output = output.head(5)  # Ensure only top 5 are shown
+    return round(scaled_avg_rating * INPUT_QUANTUM), round(scaled_votes_num * INPUT_QUANTUM)
+
+def build_user_input_vector(genres_selected, rating_step, votes_step):
+    scaled_avg_rating, scaled_votes_num = rating_step / INPUT_QUANTUM, votes_step / INPUT_QUANTUM
+    return [1 if genre in genres_selected else 0 for genre in genre_list] + [scaled_avg_rating, scaled_votes_num]
+
+def globals_ready():
+    return not any(x is None for x in [data, user_data, movie_encoder, genre_list, movie_features, vae, movie_scorer,
+                                       title_columns])
+
+def run_for_frontend(genres_selected, avg_rating, num_votes, top_n=5, filters=None):
+    """Up to top_n result rows (Rank, Movie, Genre(s), Similarity Score) with distinct titles, best first."""
+    ensure_initialized()
+    rating_step, votes_step = quantize_inputs(avg_rating, num_votes)
+    cache_key = (genre_bitmask(genres_selected, genre_list), rating_step, votes_step, top_n, filters_key(filters),
+                 model_version)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        cache_lookups.inc("hit")
+        return [dict(row) for row in cached]
+    cache_lookups.inc("miss")
+
+    with stage_seconds.time("filter"):
+        candidates = filter_candidates(filters, genres_selected)
+    user_input_vector = build_user_input_vector(genres_selected, rating_step, votes_step)
+    user_rating = DEFAULT_USER_RATING
+    if MICRO_BATCHING:
+        # Queueing plus the shared batch_user_embedding and batch_similarity stages
+        with stage_seconds.time("batch_wait"):
+            top_indices, top_scores = recommendation_batcher.submit((user_input_vector, top_n, candidates))
+        with stage_seconds.time("assembly"):
+            output = assemble_recommendations(title_columns, top_indices, top_scores)
+    else:
+        output = generate_recommendations(
+            user_rating,
+            movie_features,
+            user_input_vector,
+            vae,
+            title_columns,
+            movie_encoder,
+            top_n=top_n,
+            scorer=movie_scorer,
+            candidates=candidates
+        )
+    result_cache.put(cache_key, [dict(row) for row in output])
     return output
+
+def recommendation_records(columns, top_indices, top_scores):
+    # JSON-friendly version of assemble_recommendations, keeping tconst and genres
+    tconsts, titles = columns.tconsts[top_indices].tolist(), columns.titles[top_indices].tolist()
+    genre_lists = columns.genre_lists[top_indices].tolist()
+    return [{'rank': rank, 'tconst': tconst, 'title': title, 'genres': list(genres), 'score': score}
+            for rank, (tconst, title, genres, score) in enumerate(zip(tconsts, titles, genre_lists,
+                                                                      top_scores.tolist()), 1)]
+
+def recommend_batch(queries):
+    """Recommendations for a list of (genres_selected, avg_rating, num_votes, top_n, filters) queries.
+
+    The whole batch goes through one encoder pass and one similarity pass; the
+    result is one list of records per query, in order, or the exception raised
+    while scoring that query. filters is as for filter_candidates and may be None.
+    """
+    ensure_initialized()
+    if not queries:
+        return []
+    batch = []
+    for genres_selected, avg_rating, num_votes, top_n, filters in queries:
+        rating_step, votes_step = quantize_inputs(avg_rating, num_votes)
+        batch.append((build_user_input_vector(genres_selected, rating_step, votes_step), top_n,
+                      filter_candidates(filters, genres_selected)))
+    results = score_query_batch(batch)
+    return [result if isinstance(result, Exception) else recommendation_records(title_columns, *result)
+            for result in results]
@@ -0,0 +1,182 @@
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+
+from vae_main import CONTINUOUS_FEATURES, HIDDEN_DIMS, LATENT_DIM
+
+# Check for GPU availability
+DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+VALIDATION_FRACTION = 0.2
+VALIDATION_BATCH_SIZE = 4096 # no gradients are kept, so validation can use much larger batches
+
+class Encoder(nn.Module):
+    """ReLU hidden layers fc1..fcN, then the fc_mu / fc_log_var heads.
+
+    Called as Encoder(input_dim, *hidden_dims, latent_dim), so any depth works and
+    VAE(input_dim, *HIDDEN_DIMS, LATENT_DIM) keeps the saved layer names.
+    """
+
+    def __init__(self, input_dim, *dims):
+        super(Encoder, self).__init__()
+        *hidden_dims, latent_dim = dims
+        self.num_hidden = len(hidden_dims)
+        for i, (in_dim, out_dim) in enumerate(zip([input_dim] + hidden_dims, hidden_dims), start=1):
+            setattr(self, f"fc{i}", nn.Linear(in_dim, out_dim))
+        self.fc_mu = nn.Linear(hidden_dims[-1], latent_dim)
+        self.fc_log_var = nn.Linear(hidden_dims[-1], latent_dim)
+
+    def forward(self, x):
+        for i in range(1, self.num_hidden + 1):
+            x = F.relu(getattr(self, f"fc{i}")(x))
+        mu = self.fc_mu(x)
+        log_var = self.fc_log_var(x)
+        return mu, log_var
+
+class Decoder(nn.Module):
+    """Mirror of the Encoder: latent -> hidden_dims reversed -> fc_out with a sigmoid."""
+
+    def __init__(self, input_dim, *dims):
+        super(Decoder, self).__init__()
+        *hidden_dims, latent_dim = dims
+        hidden_dims = hidden_dims[::-1]
+        self.num_hidden = len(hidden_dims)
+        for i, (in_dim, out_dim) in enumerate(zip([latent_dim] + hidden_dims, hidden_dims), start=1):
+            setattr(self, f"fc{i}", nn.Linear(in_dim, out_dim))
+        self.fc_out = nn.Linear(hidden_dims[-1], input_dim)
+
+    def forward(self, z):
+        for i in range(1, self.num_hidden + 1):
+            z = F.relu(getattr(self, f"fc{i}")(z))
+        return torch.sigmoid(self.fc_out(z))
+
+class VAE(nn.Module):
+    def __init__(self, input_dim, *dims):
+        super(VAE, self).__init__()
+        self.encoder = Encoder(input_dim, *dims)
+        self.decoder = Decoder(input_dim, *dims)
+        self.to(DEVICE)  # Move model to GPU if available
+
+    def reparameterize(self, mu, log_var):
+        std = torch.exp(0.5 * log_var)
+        epsilon = torch.randn_like(std)
+        return mu + epsilon * std
+
+    def forward(self, x):
+        mu, log_var = self.encoder(x)
+        z = self.reparameterize(mu, log_var)
+        x_reconstructed = self.decoder(z)
+        return x_reconstructed, mu, log_var
+
+def loss_function(recon_x, x, mu, logvar, binary_mask, continuous_mask, beta=1.0):
+    # Binary Cross-Entropy for binary features
+    binary_x = x[:, binary_mask]  # Select binary features
+    recon_binary_x = recon_x[:, binary_mask]  # Reconstructed binary features
+    binary_recon_loss = F.binary_cross_entropy(recon_binary_x, binary_x, reduction='sum')
+
+    # Mean Squared Error for continuous features
+    continuous_x = x[:, continuous_mask]  # Select continuous features
+    recon_continuous_x = recon_x[:, continuous_mask]  # Reconstructed continuous features
+    continuous_recon_loss = F.mse_loss(recon_continuous_x, continuous_x, reduction='sum')
+
+    # Combine the reconstruction losses (you can scale continuous loss if necessary)
+    total_recon_loss = binary_recon_loss + beta * continuous_recon_loss
+
+    # KL Divergence Loss
+    kl_loss = -0.5 * torch.sum(1 + logvar - mu.pow(2) - logvar.exp())
+
+    # Total Loss = Reconstruction Loss + KL Divergence
+    total_loss = total_recon_loss + kl_loss
+    return total_loss
+
+def feature_masks(input_dim, num_genres=None):
+    """Column selectors for the binary genre flags and the continuous features of x_input.
+
+    create_x_input lays rows out as len(genre_list) genre flags followed by the
+    CONTINUOUS_FEATURES, so both groups are contiguous and plain slices (views) suffice.
+    """
+    if num_genres is None:
+        num_genres = input_dim - len(CONTINUOUS_FEATURES)
+    if num_genres + len(CONTINUOUS_FEATURES) != input_dim:
+        raise ValueError(f"x_input has {input_dim} columns, expected {num_genres} genres "
+                         f"+ {len(CONTINUOUS_FEATURES)} continuous features")
+    return slice(0, num_genres), slice(num_genres, input_dim)
+
+def make_optimizer(parameters, learning_rate):
+    # The fused kernel updates every parameter in one pass instead of one small op per tensor
+    parameters = list(parameters)
+    try:
+        return optim.Adam(parameters, lr=learning_rate, fused=True)
+    except (RuntimeError, TypeError):  # torch builds without a fused Adam for this device
+        return optim.Adam(parameters, lr=learning_rate)
+
+def train_vae(x_input, epochs=50, batch_size=64, learning_rate=1e-3, num_genres=None, num_threads=None, seed=None,
+              vae=None, optimizer=None, validation_fraction=VALIDATION_FRACTION):
+    """Train a VAE on x_input (rows from create_x_input); num_genres is len(genre_list).
+
+    The data stays in one contiguous tensor: each epoch gathers the training rows
+    in a fresh random order once and then slices consecutive batches from it.
+    Passing vae (and its optimizer) continues training an existing model.
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    generator = torch.Generator()
+    if seed is not None:
+        generator.manual_seed(seed)
+        torch.manual_seed(seed)
+    # Adam drives many weights and moments into denormal range, which makes every
+    # later CPU step several times slower; flushing them to zero does not change the loss
+    torch.set_flush_denormal(True)
+    print(f"🚀 Training on {DEVICE} with {torch.get_num_threads()} threads")
+
+    data = torch.from_numpy(np.ascontiguousarray(x_input, dtype=np.float32))
+    split = torch.randperm(len(data), generator=generator)
+    val_size = int(validation_fraction * len(data))
+    train_data = data[split[val_size:]].to(DEVICE)
+    val_data = data[split[:val_size]].to(DEVICE)
+
+    input_dim = data.shape[1]
+    binary_mask, continuous_mask = feature_masks(input_dim, num_genres)
+
+    if vae is None:
+        vae = VAE(input_dim, *HIDDEN_DIMS, LATENT_DIM)
+    if optimizer is None:
+        optimizer = make_optimizer(vae.parameters(), learning_rate)
+
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        total_loss = 0.0
+        vae.train()
+        shuffled = train_data[torch.randperm(len(train_data), generator=generator).to(DEVICE)]
+        for batch_start in range(0, len(shuffled), batch_size):
+            batch = shuffled[batch_start:batch_start + batch_size]
+            optimizer.zero_grad(set_to_none=True)
+            recon_batch, mu, logvar = vae(batch)
+            loss = loss_function(recon_batch, batch, mu, logvar, binary_mask, continuous_mask)
+            loss.backward()
+            total_loss += loss.item()
+            optimizer.step()
+        elapsed = time.perf_counter() - start
+
+        report = f"Epoch {epoch + 1}, Loss: {total_loss / max(1, len(train_data)):.4f}, "
+        if len(val_data):
+            report += f"Val Loss: {evaluate_vae(vae, val_data, binary_mask, continuous_mask):.4f}, "
+        print(f"{report}{len(train_data) / elapsed:,.0f} samples/s")
+
+    return vae
+
+def evaluate_vae(vae, data, binary_mask, continuous_mask, batch_size=VALIDATION_BATCH_SIZE):
+    """Mean loss per row of data, without updating the model."""
+    if len(data) == 0:
+        return float("nan")
+    vae.eval()
+    total_loss = 0.0
+    with torch.no_grad():
+        for batch_start in range(0, len(data), batch_size):
+            batch = data[batch_start:batch_start + batch_size]
+            recon_batch, mu, logvar = vae(batch)
+            total_loss += loss_function(recon_batch, batch, mu, logvar, binary_mask, continuous_mask).item()
+    return total_loss / len(data)
@@ -1,13 +1,97 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+# Checked before argparse runs, so the imports below are already timed
+if "--startup-report" in sys.argv:
+    import startup_report
+    startup_report.install()
+
 from frontend import app
-from train_save_model import train_and_save_model
+from metrics import REGISTRY
+from prefork_server import parse_bind, serve_prefork
+from vae_main import (INFERENCE_BACKEND, configure_worker_threads, ensure_initialized, preload_for_fork,
+                      start_background_initialization)
 
 TRAIN_REQUIRED = False # change to True when running for the first time
 DEBUG = False # change to True when debugging
+HOST = "0.0.0.0"
 PORT = 8080
+PRELOAD = True # load the model and catalog at startup instead of on the first request
+SERVE_MODE = "dev" # "dev" runs Flask's server; "prefork" forks --workers processes
+WORKERS_ENV = "WEB_WORKERS" # overrides the default prefork worker count, e.g. to match a container CPU quota
+THREADS_PER_WORKER = 1 # BLAS/torch threads per prefork worker
+
+def default_workers():
+    # The CPUs this process may run on (a container's cpuset), not every CPU on the host
+    if os.environ.get(WORKERS_ENV):
+        return int(os.environ[WORKERS_ENV])
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def parse_args():
+    # No abbreviations: --startup-report is spotted in sys.argv before argparse runs, so
+    # only its exact spelling may turn it on
+    parser = argparse.ArgumentParser(description="Run the Flick Finder web app", allow_abbrev=False)
+    parser.add_argument("--mode", choices=["dev", "prefork"], default=SERVE_MODE)
+    parser.add_argument("--bind", default=f"{HOST}:{PORT}", help="host:port to listen on")
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help=f"processes in prefork mode (default: usable CPUs, or ${WORKERS_ENV})")
+    parser.add_argument("--threads-per-worker", type=int, default=THREADS_PER_WORKER)
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=PRELOAD,
+                        help="load the model before serving (in prefork mode: once, in the parent)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print per-module import and initialization times, then exit without serving")
+    args = parser.parse_args()
+    if args.mode == "prefork" and args.preload and INFERENCE_BACKEND != "numpy":
+        parser.error("--preload in prefork mode needs the numpy inference backend; "
+                     "torch's thread pools do not survive fork (use --no-preload)")
+    return args
+
+def report_startup():
+    import vae_main
+    listen_after, listen_mark = startup_report.elapsed(), len(startup_report.import_records)
+    ensure_initialized()
+    ready_after = startup_report.elapsed()
+    startup_report.uninstall()
+    startup_report.print_report(listen_after, listen_mark, vae_main.startup_timings, ready_after)
 
 if __name__ == "__main__":
+    args = parse_args()
+    host, port = parse_bind(args.bind, PORT)
+    if args.startup_report:
+        report_startup()
+        sys.exit(0)
+
     if TRAIN_REQUIRED:
-        # Train and save model
+        # Train and save model; training needs torch, serving does not
+        from train_save_model import train_and_save_model
         train_and_save_model(movie_data_path="data/cleaned_data.csv", user_data_path="data/user_data.csv")
 
-    app.run(debug=DEBUG, host="0.0.0.0", port=PORT)
\ No newline at end of file
+    if args.mode == "prefork":
+        # With preload, the model, catalog and embeddings are loaded once and the
+        # workers share those pages copy-on-write; without it every worker loads its own
+        # Workers share their metrics through this directory, so /metrics reports the
+        # whole server whichever worker answers; it outlives any single worker
+        metrics_dir = tempfile.mkdtemp(prefix="flick-finder-metrics-")
+
+        def worker_init():
+            configure_worker_threads(args.threads_per_worker)
+            REGISTRY.enable_multiprocess(metrics_dir)
+            if not args.preload:
+                start_background_initialization()
+
+        try:
+            serve_prefork(app, host, port, args.workers,
+                          preload=preload_for_fork if args.preload else None, worker_init=worker_init)
+        finally:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+    else:
+        if args.preload:
+            # Loads in the background; /readyz reports 503 until it is done
+            start_background_initialization()
+
+        app.run(debug=DEBUG, host=host, port=port)